@@ -1,93 +1,670 @@
-import requests
+import asyncio
+import hashlib
 import logging
-from typing import Dict, List, Tuple
+import random
+import time
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, FrozenSet, List, Optional, Set, Tuple
+from urllib.parse import urlsplit
+
+import httpx
 
 from bot.config import Config
+from bot.deadline import Deadline, DeadlineExceeded
+from bot.keypool import ApiKey, key_pool
+from bot.latency import LatencyWindow
+from bot.metrics import stage_metrics
+from bot.payload import dumps, encode_body, loads
+from bot.prompts import SYSTEM_MESSAGE, SYSTEM_PROMPT_HASH
+from bot.ratelimit import RateLimiter
+from bot.router import ModelRouter
+from bot.scheduler import UpstreamScheduler
+from bot.tokens import budget_request, context_window, estimate_input_tokens, estimate_message_tokens, max_output_tokens
 
 logger = logging.getLogger(__name__)
 
+# === HTTP Client ===
+# One pooled client shared by every upstream call so connections are reused
+# (keep-alive / HTTP/2) and requests never block the event loop.
+_http_client: Optional[httpx.AsyncClient] = None
+
+def _http2_supported() -> bool:
+    """HTTP/2 in httpx needs the optional 'h2' package."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def init_http_client() -> httpx.AsyncClient:
+    """Create the shared upstream client. Safe to call more than once."""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        http2 = Config.HTTP2_ENABLED and _http2_supported()
+        if Config.HTTP2_ENABLED and not http2:
+            logger.warning("HTTP/2 requested but 'h2' is not installed, using HTTP/1.1")
+        
+        _http_client = httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=Config.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.HTTP_MAX_KEEPALIVE,
+                keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(Config.HTTP_TIMEOUT, connect=Config.HTTP_CONNECT_TIMEOUT)
+        )
+        logger.info(
+            f"Upstream HTTP client ready (http2={http2}, "
+            f"max_connections={Config.HTTP_MAX_CONNECTIONS}, keepalive={Config.HTTP_MAX_KEEPALIVE})"
+        )
+    return _http_client
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared upstream client, creating it lazily if needed."""
+    if _http_client is None or _http_client.is_closed:
+        return init_http_client()
+    return _http_client
+
+async def close_http_client() -> None:
+    """Close the shared upstream client and its pooled connections."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+        logger.info("Upstream HTTP client closed")
+
+# === Connection Warm-Up ===
+# A request is "cold" when no upstream traffic happened within the keep-alive
+# expiry, i.e. it likely pays DNS / TCP / TLS setup on top of model latency.
+connection_stats = {"last_activity": 0.0, "warmups": 0, "keepalives": 0, "cold_requests": 0}
+
+def _mark_activity() -> None:
+    connection_stats["last_activity"] = time.monotonic()
+
+def connections_idle_for() -> float:
+    """Seconds since the last upstream response (infinite before the first one)."""
+    if not connection_stats["last_activity"]:
+        return float("inf")
+    return time.monotonic() - connection_stats["last_activity"]
+
+async def _touch_upstream() -> None:
+    """Cheap request that opens (or keeps open) a pooled connection; any HTTP status will do."""
+    await get_http_client().head(Config.OPENROUTER_URL, timeout=Config.HTTP_CONNECT_TIMEOUT)
+    _mark_activity()
+
+async def warm_up_connections(connections: int) -> None:
+    """Open `connections` pooled connections to the upstream ahead of traffic."""
+    parts = urlsplit(Config.OPENROUTER_URL)
+    
+    with stage_metrics.timed("connection_warmup", host=parts.hostname):
+        results = await asyncio.gather(*(_touch_upstream() for _ in range(max(1, connections))), return_exceptions=True)
+    
+    failures = [r for r in results if isinstance(r, Exception)]
+    connection_stats["warmups"] += len(results) - len(failures)
+    if failures:
+        logger.warning(f"Connection warm-up: {len(failures)} of {len(results)} failed ({failures[0]})")
+    else:
+        logger.info(f"Warmed up {len(results)} upstream connection(s) to {parts.hostname}")
+
+async def keep_connections_warm() -> bool:
+    """Touch the upstream if the pool has been idle long enough that connections might expire."""
+    if connections_idle_for() < Config.KEEPALIVE_INTERVAL:
+        return False
+    try:
+        await _touch_upstream()
+    except httpx.HTTPError as e:
+        logger.warning(f"Upstream keep-alive failed: {e}")
+        return False
+    connection_stats["keepalives"] += 1
+    return True
+
 # === API Communication ===
-async def ask_openrouter(messages: List[Dict], model: str, mode: str = "free") -> Tuple[str, str]:
+PartialCallback = Callable[[str], Awaitable[None]]
+
+class _LatestPartial:
+    """Runs `on_partial` in the background, one call at a time, skipping to the newest text.
+    
+    Partial text usually goes to a Telegram edit, which the outbound limiter may
+    hold back; the SSE read loop must not wait for it.
     """
-    Enhanced API communication with dual API key support and fallback logic.
-    Returns: (response_text, model_used)
+    
+    def __init__(self, on_partial: PartialCallback):
+        self.on_partial = on_partial
+        self._latest: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def push(self, text: str) -> None:
+        self._latest = text
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._forward())
+    
+    async def _forward(self) -> None:
+        while self._latest is not None:
+            text, self._latest = self._latest, None
+            try:
+                await self.on_partial(text)
+            except Exception as e:
+                logger.debug(f"Partial text callback failed: {e}")
+    
+    async def close(self) -> None:
+        """Drop text not yet forwarded and wait for the call in progress to finish."""
+        self._latest = None
+        if self._task is not None:
+            await self._task
+
+# Client-side token buckets per key and per model (rates are configured per minute)
+rate_limiter = RateLimiter(
+    key_rate=Config.KEY_RATE_LIMIT / 60 if Config.RATE_LIMIT_ENABLED else 0,
+    key_burst=Config.KEY_RATE_BURST,
+    model_rate=Config.MODEL_RATE_LIMIT / 60 if Config.RATE_LIMIT_ENABLED else 0,
+    model_burst=Config.MODEL_RATE_BURST
+)
+
+class RateLimitedError(Exception):
+    """Upstream answered 429; the buckets involved are paused for `retry_after` seconds."""
+    
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limited by the AI service, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class TruncatedResponseError(ValueError):
+    """The completion stopped at max_tokens; a cut-off prompt is never returned or cached."""
+
+@lru_cache(maxsize=64)
+def _build_headers(api_key: str) -> Dict[str, str]:
+    """Headers for a key, built once and reused for every request (treat as read-only)."""
+    return {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": "https://github.com/your-repo",
+        "X-Title": "Advanced Prompt Enhancer Bot"
+    }
+
+def _check_status(response: httpx.Response, api_key: ApiKey, model: str) -> None:
+    """Raise for failed responses, opening the key's breaker on 401 and pausing its buckets on 429."""
+    _mark_activity()
+    rate_limiter.observe(api_key.name, response.headers)
+    
+    if response.status_code == 429:
+        raise RateLimitedError(rate_limiter.on_rate_limited(api_key.name, model, response.headers))
+    
+    if response.status_code == 401:
+        # API key is invalid, take it out of rotation
+        api_key.breaker.trip("authentication failed")
+        raise Exception("API key authentication failed")
+    
+    response.raise_for_status()
+
+async def _complete(api_key: ApiKey, data: Dict, model: str) -> Tuple[str, str]:
+    """Send a regular (non-streaming) chat completion request."""
+    response = await get_http_client().post(
+        Config.OPENROUTER_URL,
+        headers=_build_headers(api_key.key),
+        content=encode_body(data)
+    )
+    _check_status(response, api_key, model)
+    
+    result = loads(response.content)
+    if not result.get("choices"):
+        raise ValueError("Unexpected API response format")
+    if result["choices"][0].get("finish_reason") == "length":
+        raise TruncatedResponseError(f"Completion hit max_tokens ({data.get('max_tokens')})")
+    
+    # Determine which model was actually used
+    model_used = result.get("model", model)
+    
+    return result["choices"][0]["message"]["content"], model_used
+
+async def _complete_stream(api_key: ApiKey, data: Dict, model: str, on_partial: Callable[[str], None]) -> Tuple[str, str]:
+    """Send a streaming chat completion request and consume the SSE token stream.
+    
+    `on_partial` is called with the accumulated text after every content delta
+    and must not block.
     """
-    max_retries = 2
-    last_error = None
+    parts: List[str] = []
+    model_used = model
+    finish_reason = None
+    started = time.monotonic()
     
-    for attempt in range(max_retries):
-        try:
-            # Get appropriate API key
-            api_key = Config.get_api_key_for_mode(mode)
+    async with get_http_client().stream(
+        "POST",
+        Config.OPENROUTER_URL,
+        headers=_build_headers(api_key.key),
+        content=encode_body(data, stream=True)
+    ) as response:
+        if response.is_error:
+            await response.aread()
+        _check_status(response, api_key, model)
+        
+        async for line in response.aiter_lines():
+            # Blank lines separate events, lines starting with ':' are keep-alive comments
+            if not line.startswith("data:"):
+                continue
             
-            headers = {
-                "Authorization": f"Bearer {api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://github.com/your-repo",
-                "X-Title": "Advanced Prompt Enhancer Bot"
-            }
-
-            data = {
-                "model": model,
-                "messages": messages,
-                "temperature": 0.7,
-                "max_tokens": 2000
-            }
-
-            response = requests.post(
-                Config.OPENROUTER_URL,
-                headers=headers,
-                json=data,
-                timeout=45
-            )
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
             
-            if response.status_code == 401:
-                # API key is invalid, mark it as failed
-                Config.mark_api_key_failed(api_key)
-                raise Exception("API key authentication failed")
+            chunk = loads(payload)
+            if "error" in chunk:
+                raise ValueError(f"Stream error: {chunk['error'].get('message', chunk['error'])}")
             
-            response.raise_for_status()
-            
-            result = response.json()
-            if not result.get("choices"):
-                raise ValueError("Unexpected API response format")
-            
-            # Determine which model was actually used
-            model_used = result.get("model", model)
-            
-            return result["choices"][0]["message"]["content"], model_used
+            model_used = chunk.get("model", model_used)
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            finish_reason = (choices[0].get("finish_reason") if choices else None) or finish_reason
+            if delta:
+                if not parts:
+                    stage_metrics.observe("first_token", time.monotonic() - started, model=model, key=api_key.name)
+                    model_router.record_first_token(model, time.monotonic() - started)
+                parts.append(delta)
+                on_partial("".join(parts))
+    
+    if not parts:
+        raise ValueError("Unexpected API response format")
+    if finish_reason == "length":
+        raise TruncatedResponseError(f"Completion hit max_tokens ({data.get('max_tokens')})")
+    
+    return "".join(parts), model_used
+
+# === Request Coalescing ===
+# Identical (messages, model) requests that overlap share one upstream call, as long as
+# they run on the same time budget and in the same scheduler lane: a chat request must
+# not inherit an inline query's short deadline, nor an inline query a chat request's long one.
+_inflight: Dict[str, "asyncio.Task[Tuple[str, str]]"] = {}
+_waiters: Dict[asyncio.Task, int] = {}  # callers still waiting for each shared call
+coalescing_stats = {"upstream": 0, "coalesced": 0}
+
+def _request_key(messages: List[Dict], model: str, budget: float, lane: str) -> str:
+    digest = hashlib.sha256(dumps([model, budget, lane]))
+    for message in messages:
+        # The shared system message is represented by its hash instead of being re-encoded
+        digest.update(SYSTEM_PROMPT_HASH.encode("ascii") if message == SYSTEM_MESSAGE else dumps(message))
+    return digest.hexdigest()
+
+def _forget_inflight(key: str, task: asyncio.Task) -> None:
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    # Mark the exception as retrieved even if every waiter was cancelled
+    if not task.cancelled():
+        task.exception()
+
+async def ask_openrouter(
+    messages: List[Dict],
+    model: str,
+    mode: str = "free",
+    on_partial: Optional[PartialCallback] = None,
+    deadline: Optional[Deadline] = None,
+    priority: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Send a chat completion request, coalescing it with an identical in-flight one.
+    The upstream call is cancelled once every caller waiting for it is cancelled.
+    When `on_partial` is given the response is streamed and the callback receives
+    the text generated so far in the background, skipping stale text while a call
+    is still running (only the caller that started the upstream call receives
+    partial text). Only callers with the same deadline budget and lane share a
+    call. `priority` picks the scheduler lane ("admin",
+    "advanced" or "free") and defaults to the mode.
+    Oversized input is truncated, or rejected with InputTooLongError, before any
+    network I/O.
+    Returns: (response_text, model_used)
+    """
+    messages, _ = budget_request(messages, model_router.tier_for(model) or mode, model_router.rank(model))
+    deadline = deadline or Deadline(Config.REQUEST_DEADLINE)
+    lane = priority or mode
+    key = _request_key(messages, model, deadline.total, lane)
+    task = _inflight.get(key)
+    
+    if task is None:
+        coalescing_stats["upstream"] += 1
+        task = asyncio.ensure_future(_ask_openrouter(messages, model, mode, on_partial, deadline, lane))
+        _inflight[key] = task
+        task.add_done_callback(lambda t: _forget_inflight(key, t))
+    else:
+        coalescing_stats["coalesced"] += 1
+        logger.info("Coalescing identical in-flight request")
+    
+    _waiters[task] = _waiters.get(task, 0) + 1
+    try:
+        # Shield so a cancelled waiter doesn't cancel the call for everyone else
+        return await asyncio.shield(task)
+    finally:
+        _waiters[task] -= 1
+        if not _waiters[task]:
+            del _waiters[task]
+            # Nobody wants the answer any more; free its slot, key tokens and budget
+            if not task.done():
+                task.cancel()
+
+# === Scheduling ===
+upstream_scheduler = UpstreamScheduler(
+    max_concurrency=Config.UPSTREAM_MAX_CONCURRENCY,
+    default_model_limit=Config.UPSTREAM_MODEL_CONCURRENCY,
+    model_limits=Config.UPSTREAM_MODEL_LIMITS,
+    aging_seconds=Config.SCHEDULER_AGING_SECONDS
+)
+
+# === Model Routing ===
+# Each tier's configured model followed by its fallbacks; the router tracks the
+# rolling latency / error rate that hedging and fallback decisions are based on
+model_router = ModelRouter(
+    {tier: [primary, *Config.MODEL_FALLBACKS.get(tier, [])] for tier, primary in Config.MODELS.items()},
+    min_samples=Config.ROUTER_MIN_SAMPLES,
+    max_error_rate=Config.ROUTER_MAX_ERROR_RATE,
+    probe_interval=Config.ROUTER_PROBE_INTERVAL
+)
+
+# === Hedged Requests ===
+hedge_stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "saved_seconds": 0.0}
+
+class _FirstStreamWins:
+    """Forwards partial text from whichever concurrent request streams first."""
+    
+    def __init__(self, on_partial: Optional[PartialCallback]):
+        self.on_partial = on_partial
+        self.owner: Optional[int] = None
+        self.first_token_at: Optional[float] = None
+    
+    def for_request(self, index: int) -> Optional[PartialCallback]:
+        if self.on_partial is None:
+            return None
+        
+        async def forward(text: str) -> None:
+            if self.owner is None:
+                self.owner = index
+                self.first_token_at = time.monotonic()
+            if self.owner == index:
+                await self.on_partial(text)
+        
+        return forward
+
+async def _send(
+    api_key: ApiKey,
+    data: Dict,
+    model: str,
+    on_partial: Optional[PartialCallback],
+    deadline: Deadline
+) -> Tuple[str, str]:
+    """Run one upstream request on an acquired key and release the key afterwards."""
+    try:
+        # Queue behind the key's and model's rate limits rather than getting a 429
+        with stage_metrics.timed("rate_limit_wait", model=model, key=api_key.name):
+            await rate_limiter.acquire(api_key.name, model, timeout=deadline.remaining())
+    except asyncio.TimeoutError:
+        key_pool.release(api_key, None)
+        raise DeadlineExceeded("Rate limit queue is longer than the remaining time budget")
+    except BaseException:
+        key_pool.release(api_key, None)
+        raise
+    
+    started = time.monotonic()
+    cold = connections_idle_for() > Config.HTTP_KEEPALIVE_EXPIRY
+    if cold:
+        connection_stats["cold_requests"] += 1
+    partials = _LatestPartial(on_partial) if on_partial is not None else None
+    try:
+        if partials is not None:
+            result = await _complete_stream(api_key, data, model, partials.push)
+        else:
+            result = await _complete(api_key, data, model)
+    except (asyncio.CancelledError, RateLimitedError, TruncatedResponseError):
+        # None of these says anything about the key's or the model's health
+        key_pool.release(api_key, None)
+        raise
+    except Exception as e:
+        key_pool.release(api_key, False if _blames_key(e) else None)
+        model_router.record(model, False)
+        stage_metrics.observe("upstream_failed", time.monotonic() - started, model=model, key=api_key.name)
+        raise
+    else:
+        elapsed = time.monotonic() - started
+        key_pool.release(api_key, True)
+        model_router.record(model, True, elapsed)
+        # Cold requests are kept apart so the connection setup penalty stays visible
+        stage_metrics.observe("upstream_request_cold" if cold else "upstream_request", elapsed, model=model, key=api_key.name)
+        return result
+    finally:
+        if partials is not None:
+            # Outside the timings above, and on every outcome: an attempt's last partial
+            # edit must land before the result or the next attempt's edits
+            await partials.close()
+
+def _blames_key(error: Exception) -> bool:
+    """Whether a failure says something about the key rather than the model.
+    
+    Timeouts, 5xx and malformed responses are charged to the model (and routed
+    around); quota / permission errors count against the key's circuit breaker.
+    401s already tripped the breaker in _check_status.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in (402, 403)
+    return isinstance(error, httpx.TransportError) and not isinstance(error, httpx.TimeoutException)
+
+def _hedge_window(model: str, streamed: bool) -> LatencyWindow:
+    """Streamed requests can only be hedged before their first token, so they are timed by it."""
+    health = model_router.health(model)
+    return health.first_token if streamed else health.latency
+
+def _hedge_delay(model: str, streamed: bool) -> Optional[float]:
+    """Seconds to wait before hedging, or None if hedging is off or not yet calibrated."""
+    if not Config.HEDGE_ENABLED:
+        return None
+    window = _hedge_window(model, streamed)
+    if len(window) < Config.HEDGE_MIN_SAMPLES:
+        return None
+    return window.percentile(Config.HEDGE_PERCENTILE)
+
+def _hedge_budget_left() -> bool:
+    return hedge_stats["hedged"] < Config.HEDGE_MAX_RATE * hedge_stats["requests"]
+
+async def _request_with_hedge(
+    data: Dict,
+    model: str,
+    mode: str,
+    on_partial: Optional[PartialCallback],
+    exclude: FrozenSet[str],
+    tried: Set[str],
+    deadline: Deadline
+) -> Tuple[str, str]:
+    """Send a request and, if it is slower than usual, race a second one against it.
+    
+    The hedge goes to another key (or to Config.HEDGE_FALLBACK_MODEL when no other
+    key is healthy) and only when an upstream slot is free for it right away. The
+    first successful answer wins and the other request is cancelled. Requests that have already started streaming are never hedged, so
+    streamed requests wait for the usual time to first token instead of the
+    usual time to a complete answer.
+    """
+    streams = _FirstStreamWins(on_partial)
+    
+    primary_key = key_pool.acquire(mode, exclude)
+    tried.add(primary_key.name)
+    started = time.monotonic()
+    primary = asyncio.ensure_future(_send(primary_key, data, model, streams.for_request(0), deadline))
+    tasks = [primary]
+    
+    try:
+        streamed = on_partial is not None
+        delay = _hedge_delay(model, streamed)
+        if delay is None:
+            return await primary
+        
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or streams.owner is not None or not _hedge_budget_left() or deadline.expired():
+            return await primary
+        
+        hedge_model = model
+        if key_pool.has_available(mode, tried):
+            hedge_exclude: FrozenSet[str] = frozenset(tried)
+        elif Config.HEDGE_FALLBACK_MODEL and key_pool.has_available(mode, exclude):
+            hedge_exclude = exclude
+            hedge_model = Config.HEDGE_FALLBACK_MODEL
+        else:
+            return await primary
+        
+        # The hedge counts against the concurrency caps too; it never queues for a slot
+        if not upstream_scheduler.try_acquire(hedge_model):
+            return await primary
+        hedge_key = key_pool.acquire(mode, hedge_exclude)
+        if hedge_model == model:
+            tried.add(hedge_key.name)
+        
+        hedge_stats["hedged"] += 1
+        logger.info(f"Hedging slow request after {delay:.1f}s with {hedge_key.name} ({hedge_model})")
+        hedge = asyncio.ensure_future(
+            _send(hedge_key, {**data, "model": hedge_model}, hedge_model, streams.for_request(1), deadline)
+        )
+        hedge.add_done_callback(lambda _: upstream_scheduler.release(hedge_model))
+        tasks.append(hedge)
+        
+        pending = set(tasks)
+        first_error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    first_error = first_error or task.exception()
+                    continue
+                
+                if task is hedge:
+                    # The primary was cancelled, so estimate it from recent slow requests;
+                    # a streamed answer counts as arrived at its first token
+                    arrived = streams.first_token_at if streamed and streams.owner == 1 else time.monotonic()
+                    elapsed = arrived - started
+                    expected = _hedge_window(model, streamed).mean_above(delay)
+                    hedge_stats["hedge_wins"] += 1
+                    if expected:
+                        hedge_stats["saved_seconds"] += max(0.0, expected - elapsed)
+                return task.result()
+        
+        raise first_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+def _is_retryable(error: httpx.HTTPStatusError) -> bool:
+    """Client errors (bad request, payment required, ...) won't succeed on retry."""
+    status = error.response.status_code
+    return status >= 500 or status in (408, 409, 425)
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(Config.RETRY_BACKOFF_MAX, Config.RETRY_BACKOFF_BASE * 2 ** attempt))
+
+async def _ask_openrouter(
+    messages: List[Dict],
+    model: str,
+    mode: str = "free",
+    on_partial: Optional[PartialCallback] = None,
+    deadline: Optional[Deadline] = None,
+    lane: Optional[str] = None
+) -> Tuple[str, str]:
+    """
+    Enhanced API communication over the key pool within an overall deadline.
+    
+    Attempts follow a bounded plan: up to Config.MAX_ATTEMPTS tries, each on the
+    healthiest model of the requested model's tier and on a key that hasn't failed
+    this request yet (while alternatives exist), separated by jittered backoff.
+    Each attempt waits in `lane` (the mode by default) for an upstream slot of the
+    model it actually calls and gives the slot back before backing off.
+    Every attempt, backoff, slot and rate-limit wait draws from the same deadline,
+    so a request never runs longer than Config.REQUEST_DEADLINE.
+    Returns: (response_text, model_used)
+    """
+    deadline = deadline or Deadline(Config.REQUEST_DEADLINE)
+    last_error = None
+    # Counted per request, not per attempt, so HEDGE_MAX_RATE is a share of requests
+    hedge_stats["requests"] += 1
+    failed_keys: Set[str] = set()
+    failed_models: Set[str] = set()
     
-        except requests.exceptions.Timeout:
-            logger.error(f"OpenRouter API timeout (attempt {attempt + 1})")
+    # Completion budget sized from the user's input; capped per model by its context window
+    prompt_tokens = estimate_message_tokens(messages)
+    input_tokens = estimate_input_tokens(messages)
+    tier = model_router.tier_for(model) or mode
+    budget_scale = 1  # doubled after a completion is cut off at max_tokens
+    data = {
+        "model": model,
+        "messages": messages,
+        "temperature": 0.7
+    }
+    
+    for attempt in range(Config.MAX_ATTEMPTS):
+        if deadline.remaining() < Config.MIN_ATTEMPT_SECONDS:
+            logger.warning(f"Deadline budget exhausted after {attempt} attempts")
+            break
+        
+        # Prefer keys that haven't failed this request; reuse them only if nothing else is left
+        exclude = frozenset(failed_keys) if key_pool.has_available(mode, failed_keys) else frozenset()
+        tried: Set[str] = set()
+        attempt_model = model_router.pick(model, failed_models)
+        if attempt_model != model:
+            logger.info(f"Routing attempt {attempt + 1} to {attempt_model}")
+        max_tokens = max_output_tokens(input_tokens, tier, attempt_model) * budget_scale
+        
+        try:
+            with stage_metrics.timed("scheduler_wait", model=attempt_model):
+                await upstream_scheduler.acquire(lane or mode, attempt_model, timeout=deadline.remaining())
+        except asyncio.TimeoutError:
+            logger.warning(f"No upstream slot for {lane or mode} lane within the deadline")
+            last_error = "The AI service is busy right now. Please try again in a moment."
+            break
+        
+        try:
+            return await asyncio.wait_for(
+                _request_with_hedge(
+                    {
+                        **data,
+                        "model": attempt_model,
+                        "max_tokens": min(max_tokens, context_window(attempt_model) - prompt_tokens)
+                    },
+                    attempt_model, mode, on_partial, exclude, tried, deadline
+                ),
+                timeout=deadline.remaining()
+            )
+        
+        except (asyncio.TimeoutError, httpx.TimeoutException):
+            logger.error(f"OpenRouter API timeout (attempt {attempt + 1}, {deadline.elapsed():.1f}s elapsed)")
             last_error = "The AI service is taking too long to respond. Please try again."
-        except requests.exceptions.RequestException as e:
+        except DeadlineExceeded as e:
+            logger.warning(f"Giving up (attempt {attempt + 1}): {str(e)}")
+            last_error = "The AI service is busy right now. Please try again in a moment."
+            break
+        except RateLimitedError as e:
+            # The next attempt queues on the paused buckets instead of retrying immediately
+            logger.warning(f"API rate limited (attempt {attempt + 1}): {str(e)}")
+            last_error = "The AI service is busy right now. Please try again in a moment."
+        except httpx.HTTPStatusError as e:
+            logger.error(f"API request failed (attempt {attempt + 1}): {str(e)}")
+            last_error = f"Failed to communicate with the AI service: {str(e)}"
+            # Client errors only stand a chance on a different model
+            if not _is_retryable(e) and model_router.pick(model, failed_models | {attempt_model}) == attempt_model:
+                break
+        except httpx.HTTPError as e:
             logger.error(f"API request failed (attempt {attempt + 1}): {str(e)}")
             last_error = f"Failed to communicate with the AI service: {str(e)}"
+        except TruncatedResponseError as e:
+            logger.warning(f"Truncated completion from {attempt_model} (attempt {attempt + 1}): {str(e)}")
+            last_error = "The AI service cut the answer short. Please try again."
+            budget_scale *= 2
         except ValueError as e:
             logger.error(f"API response parsing failed (attempt {attempt + 1}): {str(e)}")
             last_error = "Received an unexpected response from the AI service."
         except Exception as e:
             logger.error(f"Unexpected error (attempt {attempt + 1}): {str(e)}")
             last_error = str(e)
-            
-            # If this was the last attempt, check if we can try with the other API key
-            if attempt == max_retries - 1:
-                # If we're using key_01 and key_02 is available, try again with key_02
-                if mode == "free" and Config.api_status["key_02"] and Config.OPENROUTER_API_KEY_02:
-                    Config.mark_api_key_failed(api_key)  # Mark current key as failed
-                    logger.info("Retrying with API key 02 as fallback")
-                    try:
-                        return await ask_openrouter(messages, model, "advanced")
-                    except Exception as inner_e:
-                        last_error = str(inner_e)
-                # If we're using key_02 and key_01 is available, try again with key_01
-                elif mode == "advanced" and Config.api_status["key_01"] and Config.OPENROUTER_API_KEY_01:
-                    Config.mark_api_key_failed(api_key)  # Mark current key as failed
-                    logger.info("Retrying with API key 01 as fallback")
-                    try:
-                        return await ask_openrouter(messages, model, "free")
-                    except Exception as inner_e:
-                        last_error = str(inner_e)
-    
-    # If all retries failed, raise the last error
-    raise Exception(last_error or "Failed to get response from AI service")
\ No newline at end of file
+        finally:
+            upstream_scheduler.release(attempt_model)
+        
+        failed_keys |= tried
+        failed_models.add(attempt_model)
+        
+        if attempt < Config.MAX_ATTEMPTS - 1:
+            backoff = _backoff(attempt)
+            if deadline.remaining() - backoff < Config.MIN_ATTEMPT_SECONDS:
+                break
+            await asyncio.sleep(backoff)
+    
+    # If all attempts failed, raise the last error
+    raise Exception(last_error or "Failed to get response from AI service")
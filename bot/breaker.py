@@ -0,0 +1,136 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Dict
+
+logger = logging.getLogger(__name__)
+
+# === Circuit Breaker ===
+class CircuitBreaker:
+    """Per-key circuit breaker with closed / open / half-open states.
+    
+    The breaker opens after `failure_threshold` consecutive failures, or when the
+    error rate over the last `window_size` calls reaches `error_rate_threshold`
+    (once at least `min_requests` calls were seen). After `open_seconds` it moves
+    to half-open and lets `half_open_max_calls` trial requests through: a success
+    closes it again, a failure re-opens it.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 3,
+        error_rate_threshold: float = 0.5,
+        window_size: int = 20,
+        min_requests: int = 5,
+        open_seconds: float = 15.0,
+        half_open_max_calls: int = 1
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.error_rate_threshold = error_rate_threshold
+        self.min_requests = min_requests
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = half_open_max_calls
+        
+        self._outcomes: deque = deque(maxlen=window_size)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._consecutive_failures = 0
+        self._trial_calls = 0
+        self._trial_started_at = 0.0
+    
+    @property
+    def state(self) -> str:
+        # Open breakers become half-open lazily once the cool-down has elapsed
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._trial_calls = 0
+            logger.info(f"Circuit breaker {self.name} half-open, allowing trial requests")
+        return self._state
+    
+    def is_available(self) -> bool:
+        """Whether a request could currently be sent (does not reserve a trial slot)."""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN:
+            return self._trial_calls < self.half_open_max_calls or self._trial_expired()
+        return False
+    
+    def allow_request(self) -> bool:
+        """Reserve the right to send a request; half-open breakers hand out trial slots."""
+        if not self.is_available():
+            return False
+        if self._state == self.HALF_OPEN:
+            if self._trial_expired():
+                self._trial_calls = 0
+            self._trial_calls += 1
+            self._trial_started_at = time.monotonic()
+        return True
+    
+    def record_success(self) -> None:
+        self._outcomes.append(True)
+        self._consecutive_failures = 0
+        if self._state == self.HALF_OPEN:
+            logger.info(f"Circuit breaker {self.name} closed after successful trial request")
+            self._state = self.CLOSED
+            self._outcomes.clear()
+    
+    def record_failure(self) -> None:
+        self._outcomes.append(False)
+        self._consecutive_failures += 1
+        
+        if self._state == self.HALF_OPEN:
+            self._open("trial request failed")
+        elif self._state == self.CLOSED:
+            if self._consecutive_failures >= self.failure_threshold:
+                self._open(f"{self._consecutive_failures} consecutive failures")
+            elif len(self._outcomes) >= self.min_requests and self.error_rate >= self.error_rate_threshold:
+                self._open(f"error rate {self.error_rate:.0%}")
+    
+    def trip(self, reason: str = "forced") -> None:
+        """Open the breaker immediately (e.g. on an authentication error)."""
+        self._outcomes.append(False)
+        self._open(reason)
+    
+    def reset(self) -> None:
+        self._state = self.CLOSED
+        self._outcomes.clear()
+        self._consecutive_failures = 0
+        self._trial_calls = 0
+    
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+    
+    def retry_in(self) -> float:
+        """Seconds until an open breaker goes half-open (0 if not open)."""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "error_rate": self.error_rate,
+            "consecutive_failures": self._consecutive_failures,
+            "retry_in": self.retry_in()
+        }
+    
+    def _open(self, reason: str) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._trial_calls = 0
+        logger.error(f"Circuit breaker {self.name} opened ({reason}), retrying in {self.open_seconds:.0f}s")
+    
+    def _trial_expired(self) -> bool:
+        # A trial whose outcome was never recorded (e.g. cancelled) must not block recovery
+        return self._trial_calls > 0 and time.monotonic() - self._trial_started_at >= self.open_seconds
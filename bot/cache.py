@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from bot.config import Config
+from bot.database import feedback_db
+from bot.prompts import SYSTEM_PROMPT_HASH
+
+logger = logging.getLogger(__name__)
+
+# === In-Memory LRU ===
+class LRUCache:
+    """Size-capped LRU cache whose entries expire after `ttl` seconds."""
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+    
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        
+        created_at, value = entry
+        if time.time() - created_at > self.ttl:
+            del self._entries[key]
+            return None
+        
+        self._entries.move_to_end(key)
+        return value
+    
+    def set(self, key: str, value: Any, created_at: Optional[float] = None) -> None:
+        self._entries[key] = (created_at or time.time(), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# === Enhancement Cache ===
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_input(text: str) -> str:
+    """Normalize user input so trivially different requests share a cache entry."""
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+class EnhancementCache:
+    """Two-tier cache for enhanced prompts: in-process LRU in front of SQLite.
+    
+    Keys combine the normalized input, the model and the system prompt hash, so
+    editing the system prompt or switching models never returns a stale result.
+    Writes to SQLite are buffered and committed in batches by `flush()`, so a
+    cache miss does not pay for a disk commit on the event loop.
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.ttl = ttl
+        self.memory = LRUCache(max_size, ttl)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self._pending: Dict[str, Tuple[str, str, float]] = {}
+    
+    @staticmethod
+    def make_key(user_input: str, model: str) -> str:
+        raw = f"{SYSTEM_PROMPT_HASH}|{model}|{normalize_input(user_input)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def get(self, user_input: str, model: str) -> Optional[Tuple[str, str]]:
+        """Return (enhanced_text, model_used) or None on a miss."""
+        key = self.make_key(user_input, model)
+        
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        
+        pending = self._pending.get(key)
+        if pending is not None and time.time() - pending[2] <= self.ttl:
+            self.memory_hits += 1
+            value = (pending[0], pending[1])
+            self.memory.set(key, value, pending[2])
+            return value
+        
+        row = feedback_db.get_cached_enhancement(key, time.time() - self.ttl)
+        if row is not None:
+            self.db_hits += 1
+            value = (row["enhanced_text"], row["model_used"])
+            self.memory.set(key, value, row["created_at"])
+            return value
+        
+        self.misses += 1
+        return None
+    
+    def set(self, user_input: str, model: str, enhanced_text: str, model_used: str) -> None:
+        key = self.make_key(user_input, model)
+        created_at = time.time()
+        self.memory.set(key, (enhanced_text, model_used), created_at)
+        
+        self._pending[key] = (enhanced_text, model_used, created_at)
+        if len(self._pending) >= Config.CACHE_FLUSH_BATCH:
+            self.flush()
+    
+    def flush(self) -> int:
+        """Write buffered entries to the persistent tier in one transaction."""
+        if not self._pending:
+            return 0
+        
+        rows = [(key, text, model_used, created_at) for key, (text, model_used, created_at) in self._pending.items()]
+        self._pending.clear()
+        if not feedback_db.store_cached_enhancements(rows):
+            return 0
+        return len(rows)
+    
+    def purge_expired(self) -> int:
+        """Drop expired rows from the persistent tier."""
+        self.flush()
+        return feedback_db.purge_cached_enhancements(time.time() - self.ttl)
+    
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.db_hits
+        total = hits + self.misses
+        return {
+            "hits": hits,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": (hits / total * 100) if total else 0.0,
+            "size": len(self.memory),
+            "pending_writes": len(self._pending)
+        }
+
+# Create a singleton instance
+enhancement_cache = EnhancementCache(Config.CACHE_MAX_SIZE, Config.CACHE_TTL)
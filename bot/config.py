@@ -1,82 +1,218 @@
 import os
+import re
 import logging
+import secrets
 from dotenv import load_dotenv
 
+from bot.breaker import CircuitBreaker
+
 # Load environment variables
 load_dotenv()
 
+def _env_bool(name: str, default: str = "false") -> bool:
+    """Read a boolean flag from the environment."""
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
 # === Configuration ===
 class Config:
     # Admin user IDs (for administrative commands)
     ADMIN_IDS = [int(id.strip()) for id in os.getenv("ADMIN_IDS", "").split(",") if id.strip()]
     TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
+    # Point at a local Bot API (scripts/webhook_harness.py) to measure update latency
+    TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+    
+    # Update delivery: "polling" or "webhook" (plain HTTP listener behind a TLS-terminating proxy)
+    UPDATE_MODE = os.getenv("UPDATE_MODE", "polling").lower()
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # public https URL registered with Telegram
+    WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+    # Telegram echoes this in every webhook request; a random one is generated per run if unset
+    WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN") or secrets.token_urlsafe(32)
+    WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    # Updates received but not yet dispatched; intake waits when full
+    UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "256"))
+    # Handlers running at once across users (1 = sequential); each user's updates stay in order
+    UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+    UPDATE_MAX_PENDING = int(os.getenv("UPDATE_MAX_PENDING", "256"))  # incl. those waiting for the same user
     OPENROUTER_API_KEY_01 = os.getenv("OPENROUTER_API_KEY_01")  # Free mode default
     OPENROUTER_API_KEY_02 = os.getenv("OPENROUTER_API_KEY_02")  # Advanced mode default
+    # Key pool: comma-separated `key[:weight[:mode|mode]]`, overrides the two keys above
+    OPENROUTER_API_KEYS = [k.strip() for k in os.getenv("OPENROUTER_API_KEYS", "").split(",") if k.strip()]
+    OPENROUTER_KEY_STRATEGY = os.getenv("OPENROUTER_KEY_STRATEGY", "least_outstanding")  # or weighted_round_robin
     
-    OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+    # Point at a local stub (scripts/openrouter_stub.py) to test without the live service
+    OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
     MODELS = {
         "free": "deepseek/deepseek-r1-0528-qwen3-8b:free",
         "advanced": "anthropic/claude-3-opus",
     }
+    # Ordered fallback candidates per tier (comma-separated), tried after the model above
+    MODEL_FALLBACKS = {
+        "free": [m.strip() for m in os.getenv("FREE_MODEL_FALLBACKS", "").split(",") if m.strip()],
+        "advanced": [m.strip() for m in os.getenv("ADVANCED_MODEL_FALLBACKS", "").split(",") if m.strip()],
+    }
+    ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "5"))  # before a model's stats are trusted
+    ROUTER_MAX_ERROR_RATE = float(os.getenv("ROUTER_MAX_ERROR_RATE", "0.3"))
+    ROUTER_PROBE_INTERVAL = float(os.getenv("ROUTER_PROBE_INTERVAL", "60"))  # seconds before retrying an unhealthy model
     
-    # API key status tracking
-    api_status = {
-        "key_01": True,  # Available
-        "key_02": True   # Available
+    # Token budgeting from local estimates (tokens)
+    MAX_INPUT_TOKENS = int(os.getenv("MAX_INPUT_TOKENS", "3000"))  # longer inputs are truncated or rejected
+    INPUT_OVERFLOW = os.getenv("INPUT_OVERFLOW", "truncate")  # or reject
+    MIN_OUTPUT_TOKENS = int(os.getenv("MIN_OUTPUT_TOKENS", "400"))
+    BASE_OUTPUT_TOKENS = int(os.getenv("BASE_OUTPUT_TOKENS", "700"))
+    OUTPUT_TOKENS_PER_INPUT = float(os.getenv("OUTPUT_TOKENS_PER_INPUT", "2.0"))  # per token of user input
+    # Reasoning models spend part of max_tokens on hidden reasoning, so they never get less than this
+    REASONING_MODELS = [
+        m.strip() for m in os.getenv("REASONING_MODELS", "deepseek/deepseek-r1-0528-qwen3-8b:free").split(",") if m.strip()
+    ]
+    REASONING_MIN_OUTPUT_TOKENS = int(os.getenv("REASONING_MIN_OUTPUT_TOKENS", "2000"))
+    MAX_OUTPUT_TOKENS = {
+        "free": int(os.getenv("FREE_MAX_OUTPUT_TOKENS", "1500")),
+        "advanced": int(os.getenv("ADVANCED_MAX_OUTPUT_TOKENS", "2000")),
+    }
+    DEFAULT_CONTEXT_WINDOW = int(os.getenv("DEFAULT_CONTEXT_WINDOW", "8192"))
+    # Per-model context windows: comma-separated `model=tokens`
+    MODEL_CONTEXT_WINDOWS = {
+        name.strip(): int(tokens)
+        for name, _, tokens in (
+            item.partition("=") for item in os.getenv("MODEL_CONTEXT_WINDOWS", "").split(",") if "=" in item
+        )
     }
     
-    @classmethod
-    def get_api_key_for_mode(cls, mode: str) -> str:
-        """Get the appropriate API key for the given mode with fallback logic."""
-        if mode == "free":
-            # Try API key 01 first (default for free)
-            if cls.api_status["key_01"] and cls.OPENROUTER_API_KEY_01:
-                return cls.OPENROUTER_API_KEY_01
-            # Fallback to API key 02
-            elif cls.api_status["key_02"] and cls.OPENROUTER_API_KEY_02:
-                logger.warning("API key 01 unavailable, using API key 02 for free mode")
-                return cls.OPENROUTER_API_KEY_02
-        else:  # advanced mode
-            # Try API key 02 first (default for advanced)
-            if cls.api_status["key_02"] and cls.OPENROUTER_API_KEY_02:
-                return cls.OPENROUTER_API_KEY_02
-            # Fallback to API key 01
-            elif cls.api_status["key_01"] and cls.OPENROUTER_API_KEY_01:
-                logger.warning("API key 02 unavailable, using API key 01 for advanced mode")
-                return cls.OPENROUTER_API_KEY_01
-        
-        raise ValueError("No API keys available")
+    # Shared upstream HTTP client (connection pool / keep-alive / HTTP/2)
+    HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "45"))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+    HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+    HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+    HTTP2_ENABLED = _env_bool("HTTP2_ENABLED", "true")
+    PREWARM_CONNECTIONS = int(os.getenv("PREWARM_CONNECTIONS", "2"))  # opened at startup, 0 disables
+    KEEPALIVE_INTERVAL = float(os.getenv("KEEPALIVE_INTERVAL", "30"))  # idle seconds before a keep-alive (keep well below the expiry), 0 disables
     
-    @classmethod
-    def mark_api_key_failed(cls, api_key: str):
-        """Mark an API key as failed."""
-        if api_key == cls.OPENROUTER_API_KEY_01:
-            cls.api_status["key_01"] = False
-            logger.error("API key 01 marked as failed")
-        elif api_key == cls.OPENROUTER_API_KEY_02:
-            cls.api_status["key_02"] = False
-            logger.error("API key 02 marked as failed")
+    # Stream completions and show partial text by editing the progress message
+    STREAM_RESPONSES = _env_bool("STREAM_RESPONSES", "true")
+    STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))  # seconds between edits
+    
+    # Deliver the result and the action buttons in one edit of the progress message when they fit;
+    # those buttons then answer with new messages so the result is never overwritten
+    COMPACT_REPLIES = _env_bool("COMPACT_REPLIES", "true")
+    # Results longer than this (characters) are sent as a .txt document instead of messages
+    DOCUMENT_THRESHOLD = int(os.getenv("DOCUMENT_THRESHOLD", "12000"))
+    
+    # Inline mode (`@bot <idea>`): enhance once typing pauses, answer repeats from a short-lived cache
+    INLINE_ENABLED = _env_bool("INLINE_ENABLED", "true")
+    INLINE_DEBOUNCE = float(os.getenv("INLINE_DEBOUNCE", "0.8"))  # seconds without a newer query
+    INLINE_MIN_CHARS = int(os.getenv("INLINE_MIN_CHARS", "3"))
+    INLINE_CACHE_TTL = float(os.getenv("INLINE_CACHE_TTL", "300"))
+    INLINE_CACHE_SIZE = int(os.getenv("INLINE_CACHE_SIZE", "500"))
+    INLINE_DEADLINE = float(os.getenv("INLINE_DEADLINE", "9"))  # answers are refused after ~10s
+    
+    # Enhancement result cache (in-memory LRU backed by the feedback database)
+    CACHE_ENABLED = _env_bool("CACHE_ENABLED", "true")
+    CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "1000"))
+    CACHE_TTL = int(os.getenv("CACHE_TTL", "86400"))  # seconds
+    CACHE_FLUSH_INTERVAL = float(os.getenv("CACHE_FLUSH_INTERVAL", "5"))  # seconds between batched SQLite writes
+    CACHE_FLUSH_BATCH = int(os.getenv("CACHE_FLUSH_BATCH", "50"))  # pending writes that trigger an early flush
+    # Reuse enhancements of near-duplicate inputs (MinHash similarity, in memory only)
+    SIMILARITY_ENABLED = _env_bool("SIMILARITY_ENABLED", "true")
+    SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.9"))  # estimated Jaccard, 0-1
+    SIMILARITY_MAX_ENTRIES = int(os.getenv("SIMILARITY_MAX_ENTRIES", "5000"))
+    SIMILARITY_BANDS = int(os.getenv("SIMILARITY_BANDS", "16"))
+    SIMILARITY_ROWS = int(os.getenv("SIMILARITY_ROWS", "4"))
+    
+    # End-to-end deadline per enhancement; attempts, backoff and fallbacks share it
+    REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))  # seconds
+    MAX_ATTEMPTS = int(os.getenv("MAX_ATTEMPTS", "3"))
+    MIN_ATTEMPT_SECONDS = float(os.getenv("MIN_ATTEMPT_SECONDS", "3"))  # don't start an attempt with less left
+    RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", "0.5"))
+    RETRY_BACKOFF_MAX = float(os.getenv("RETRY_BACKOFF_MAX", "4"))
+    
+    # Upstream scheduler: global / per-model concurrency caps and lane aging
+    UPSTREAM_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_MAX_CONCURRENCY", "20"))
+    UPSTREAM_MODEL_CONCURRENCY = int(os.getenv("UPSTREAM_MODEL_CONCURRENCY", "10"))  # default per model
+    # Per-model overrides: comma-separated `model=limit`
+    UPSTREAM_MODEL_LIMITS = {
+        name.strip(): int(limit)
+        for name, _, limit in (
+            item.partition("=") for item in os.getenv("UPSTREAM_MODEL_LIMITS", "").split(",") if "=" in item
+        )
+    }
+    SCHEDULER_AGING_SECONDS = float(os.getenv("SCHEDULER_AGING_SECONDS", "10"))  # wait that promotes a lane
+    
+    # Hedged requests: race a second request when the first is slower than usual
+    HEDGE_ENABLED = _env_bool("HEDGE_ENABLED", "false")
+    HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))  # of recent latencies (time to first token when streaming)
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_MAX_RATE = float(os.getenv("HEDGE_MAX_RATE", "0.1"))  # max fraction of requests hedged
+    HEDGE_FALLBACK_MODEL = os.getenv("HEDGE_FALLBACK_MODEL", "")  # used when no other key is healthy
+    
+    # Client-side rate limiting (token buckets, requests per minute)
+    RATE_LIMIT_ENABLED = _env_bool("RATE_LIMIT_ENABLED", "true")
+    KEY_RATE_LIMIT = float(os.getenv("KEY_RATE_LIMIT", "60"))
+    KEY_RATE_BURST = float(os.getenv("KEY_RATE_BURST", "10"))
+    MODEL_RATE_LIMIT = float(os.getenv("MODEL_RATE_LIMIT", "20"))
+    MODEL_RATE_BURST = float(os.getenv("MODEL_RATE_BURST", "5"))
+    
+    # Outbound Telegram rate limiting (Bot API flood limits)
+    TELEGRAM_RATE_LIMIT_ENABLED = _env_bool("TELEGRAM_RATE_LIMIT_ENABLED", "true")
+    TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # calls per second
+    TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))  # messages per second per private chat
+    TELEGRAM_CHAT_BURST = float(os.getenv("TELEGRAM_CHAT_BURST", "5"))
+    TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", "20"))  # messages per minute per group
+    TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))  # after RetryAfter
+    TELEGRAM_NETWORK_RETRIES = int(os.getenv("TELEGRAM_NETWORK_RETRIES", "2"))
+    
+    # Per-stage latency histograms; the local endpoint is off unless a port is set
+    METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+    METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+    
+    # Per-key circuit breakers
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))  # consecutive failures
+    BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+    BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))  # calls considered for the error rate
+    BREAKER_MIN_REQUESTS = int(os.getenv("BREAKER_MIN_REQUESTS", "5"))
+    BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "15"))
+    BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
     
     @classmethod
-    def reset_api_status(cls):
-        """Reset API key status (call periodically to retry failed keys)."""
-        cls.api_status = {"key_01": True, "key_02": True}
+    def new_breaker(cls, name: str) -> CircuitBreaker:
+        """Create a circuit breaker using the configured thresholds."""
+        return CircuitBreaker(
+            name,
+            failure_threshold=cls.BREAKER_FAILURE_THRESHOLD,
+            error_rate_threshold=cls.BREAKER_ERROR_RATE,
+            window_size=cls.BREAKER_WINDOW,
+            min_requests=cls.BREAKER_MIN_REQUESTS,
+            open_seconds=cls.BREAKER_OPEN_SECONDS,
+            half_open_max_calls=cls.BREAKER_HALF_OPEN_CALLS
+        )
     
     @classmethod
     def validate(cls):
         if not cls.TELEGRAM_BOT_TOKEN:
             raise ValueError("TELEGRAM_BOT_TOKEN not found in environment variables")
-        if not cls.OPENROUTER_API_KEY_01 and not cls.OPENROUTER_API_KEY_02:
+        if not cls.OPENROUTER_API_KEYS and not cls.OPENROUTER_API_KEY_01 and not cls.OPENROUTER_API_KEY_02:
             raise ValueError("At least one OPENROUTER_API_KEY must be provided")
+        if cls.UPDATE_MODE not in ("polling", "webhook"):
+            raise ValueError(f"UPDATE_MODE must be 'polling' or 'webhook', got '{cls.UPDATE_MODE}'")
+        if cls.UPDATE_MODE == "webhook":
+            if not cls.WEBHOOK_URL:
+                raise ValueError("WEBHOOK_URL must be set when UPDATE_MODE is 'webhook'")
+            if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", cls.WEBHOOK_SECRET_TOKEN):
+                raise ValueError("WEBHOOK_SECRET_TOKEN may only contain A-Z, a-z, 0-9, _ and - (1-256 characters)")
         
         # Log available API keys
-        keys_available = []
-        if cls.OPENROUTER_API_KEY_01:
-            keys_available.append("API_KEY_01")
-        if cls.OPENROUTER_API_KEY_02:
-            keys_available.append("API_KEY_02")
-        
-        logger.info(f"Available API keys: {', '.join(keys_available)}")
+        if cls.OPENROUTER_API_KEYS:
+            logger.info(f"Available API keys: {len(cls.OPENROUTER_API_KEYS)} from OPENROUTER_API_KEYS")
+        else:
+            keys_available = []
+            if cls.OPENROUTER_API_KEY_01:
+                keys_available.append("API_KEY_01")
+            if cls.OPENROUTER_API_KEY_02:
+                keys_available.append("API_KEY_02")
+            
+            logger.info(f"Available API keys: {', '.join(keys_available)}")
 
 # === Setup logging ===
 logging.basicConfig(
@@ -1,7 +1,7 @@
 import sqlite3
 import logging
 from datetime import datetime
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 import os
 
 logger = logging.getLogger(__name__)
@@ -45,6 +45,18 @@ class FeedbackDatabase:
             # Add index on user_id for better query performance
             self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedback_user_id ON feedback(user_id)')
             
+            # Create enhancement cache table (persistent tier of bot.cache)
+            self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS enhancement_cache (
+                cache_key TEXT PRIMARY KEY,
+                enhanced_text TEXT NOT NULL,
+                model_used TEXT,
+                created_at REAL NOT NULL
+            )
+            ''')
+            
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_cache_created_at ON enhancement_cache(created_at)')
+            
             self.conn.commit()
             logger.info(f"Database initialized at {self.db_path}")
         except sqlite3.OperationalError as e:
@@ -132,6 +144,68 @@ class FeedbackDatabase:
             logger.error(f"Error retrieving user feedback from database: {e}")
             return []
     
+    def get_cached_enhancement(self, cache_key: str, min_created_at: float) -> Optional[Dict]:
+        """Retrieve a cached enhancement newer than `min_created_at` (epoch seconds)
+        
+        Args:
+            cache_key: The cache key computed by bot.cache
+            min_created_at: Entries created before this time are treated as expired
+            
+        Returns:
+            A dict with enhanced_text, model_used and created_at, or None on a miss
+        """
+        try:
+            self.cursor.execute(
+                "SELECT enhanced_text, model_used, created_at FROM enhancement_cache WHERE cache_key = ? AND created_at >= ?",
+                (cache_key, min_created_at)
+            )
+            row = self.cursor.fetchone()
+            if row is None:
+                return None
+            
+            return {
+                "enhanced_text": row[0],
+                "model_used": row[1],
+                "created_at": row[2]
+            }
+        except Exception as e:
+            logger.error(f"Error reading enhancement cache: {e}")
+            return None
+    
+    def store_cached_enhancements(self, rows: List[Tuple[str, str, Optional[str], float]]) -> bool:
+        """Insert or replace cached enhancements in a single transaction
+        
+        Args:
+            rows: (cache_key, enhanced_text, model_used, created_at) tuples
+            
+        Returns:
+            True if the rows were written, False otherwise
+        """
+        try:
+            self.cursor.executemany(
+                "INSERT OR REPLACE INTO enhancement_cache (cache_key, enhanced_text, model_used, created_at) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self.conn.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error writing enhancement cache: {e}")
+            return False
+    
+    def purge_cached_enhancements(self, min_created_at: float) -> int:
+        """Delete cached enhancements created before `min_created_at`
+        
+        Returns:
+            The number of deleted rows
+        """
+        try:
+            self.cursor.execute("DELETE FROM enhancement_cache WHERE created_at < ?", (min_created_at,))
+            self.conn.commit()
+            return self.cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error purging enhancement cache: {e}")
+            return 0
+    
     def close(self) -> None:
         """Close the database connection"""
         if self.conn:
@@ -139,4 +213,4 @@ class FeedbackDatabase:
             logger.info("Database connection closed")
 
 # Create a singleton instance
-feedback_db = FeedbackDatabase()
\ No newline at end of file
+feedback_db = FeedbackDatabase(os.getenv("FEEDBACK_DB_PATH", "feedback.db"))
\ No newline at end of file
@@ -0,0 +1,21 @@
+import time
+
+# === Deadline Budget ===
+class DeadlineExceeded(Exception):
+    """Raised when the remaining time budget cannot cover the next step."""
+
+class Deadline:
+    """An absolute point in time that every step of a request draws its budget from."""
+    
+    def __init__(self, seconds: float):
+        self.total = seconds
+        self.expires_at = time.monotonic() + seconds
+    
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+    
+    def elapsed(self) -> float:
+        return self.total - (self.expires_at - time.monotonic())
+    
+    def expired(self) -> bool:
+        return self.remaining() <= 0
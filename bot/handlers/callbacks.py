@@ -5,8 +5,9 @@ from telegram.ext import ContextTypes
 
 from bot.models import get_user_session
 from bot.config import Config
-from bot.handlers.messages import show_history
-from bot.handlers.commands import start
+from bot.handlers.messages import respond_to_button, show_history
+from bot.handlers.commands import start, format_key_pool_status
+from bot.keypool import key_pool
 
 logger = logging.getLogger(__name__)
 
@@ -24,7 +25,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         # Update last interaction time
         session.last_interaction = datetime.now()
         if data.startswith('improve:'):
-            await query.edit_message_text(
+            await respond_to_button(
+                query,
                 "🔄 <b>Improve Your Prompt</b>\n\n"
                 "Please send your additional improvement instructions or feedback about the previous prompt.",
                 parse_mode='HTML'
@@ -47,41 +49,16 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
             await query.edit_message_text(help_text, reply_markup=reply_markup, parse_mode='HTML')
             
-        elif data == 'view_history':
-            if not session.history:
-                keyboard = [[InlineKeyboardButton("🔙 Back to Main", callback_data='back_to_main')]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await query.edit_message_text(
-                    "📜 <b>Your History is Empty</b>\n\n"
-                    "You haven't enhanced any prompts yet. Start by sending me an idea!",
-                    reply_markup=reply_markup,
-                    parse_mode='HTML'
-                )
-                return
-            
-            history_text = "📜 <b>Your Recent Prompts:</b>\n\n"
-            for i, item in enumerate(reversed(session.history[-5:]), 1):  # Show last 5
-                timestamp = datetime.fromisoformat(item['timestamp']).strftime('%m/%d %H:%M')
-                history_text += (
-                    f"<b>#{i}.</b> {item['original'][:80]}{'...' if len(item['original']) > 80 else ''}\n"
-                    f"<i>🕒 {timestamp}</i>\n\n"
-                )
-            
-            keyboard = [
-                [InlineKeyboardButton("📋 View Full History", callback_data='full_history')],
-                [InlineKeyboardButton("🔙 Back to Main", callback_data='back_to_main')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(
-                history_text,
-                reply_markup=reply_markup,
-                parse_mode='HTML'
-            )
-            
-        elif data == 'full_history':
+        elif data in ('view_history', 'full_history'):
             await show_history(update, context)
             
+        elif data.startswith('hist:'):
+            try:
+                page = int(data.split(':', 1)[1])
+            except ValueError:
+                page = 0
+            await show_history(update, context, page)
+            
         elif data == 'examples':
             examples = (
                 "💡 <b>Example Inputs & Outputs:</b>\n\n"
@@ -196,7 +173,7 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             
         elif data == 'confirm_clear':
-            session.history = []
+            session.clear_history()
             keyboard = [[InlineKeyboardButton("🔙 Back to Main", callback_data='back_to_main')]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
@@ -208,18 +185,13 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             
         elif data == 'bot_status':
-            # Check API key status
-            api1_status = "✅ Online" if Config.api_status["key_01"] else "❌ Offline"
-            api2_status = "✅ Online" if Config.api_status["key_02"] else "❌ Offline"
-            
             status_text = (
                 "📊 <b>Bot Status</b>\n\n"
-                f"<b>Deepseek (Free):</b> {api1_status}\n"
-                f"<b>claude (Advanced):</b> {api2_status}\n\n"
+                f"{format_key_pool_status()}\n\n"
                 f"<b>Total Users:</b> {len(get_user_session.__globals__['user_sessions'])}\n"
                 f"<b>Total Prompts Generated:</b> {sum(len(session.history) for session in get_user_session.__globals__['user_sessions'].values())}\n"
                 f"<b>Bot Uptime:</b> Since last restart\n\n"
-                "<i>Note: If an API key is offline, the bot will automatically use the working key for both modes.</i>"
+                "<i>Note: If an API key is offline, the bot automatically moves its requests to the other working keys.</i>"
             )
             
             keyboard = [
@@ -235,14 +207,14 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             )
             
         elif data == 'reset_api':
-            Config.reset_api_status()
+            key_pool.reset()
             keyboard = [[InlineKeyboardButton("🔙 Back to Status", callback_data='bot_status')]]
             reply_markup = InlineKeyboardMarkup(keyboard)
             
             await query.edit_message_text(
                 "✅ <b>API Status Reset!</b>\n\n"
                 "All API keys have been marked as available again.\n"
-                "The bot will retry using both keys.",
+                "The bot will retry using all of them.",
                 reply_markup=reply_markup,
                 parse_mode='HTML'
             )
@@ -288,7 +260,8 @@ async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             
     except Exception as e:
         logger.error(f"Error in button_handler: {str(e)}")
-        await query.edit_message_text(
+        await respond_to_button(
+            query,
             "😞 <b>Something went wrong</b>\n\n"
             "Please try again or use /help for assistance.",
             parse_mode='HTML'
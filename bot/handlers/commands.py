@@ -5,10 +5,36 @@ from telegram.ext import ContextTypes
 
 from bot.models import get_user_session
 from bot.config import Config
-from bot.handlers.messages import show_history
+from bot.cache import enhancement_cache
+from bot.similarity import similarity_index
+from bot.outbound import outbound_limiter
+from bot.updates import update_processor
+from bot.metrics import call_metrics
+from bot.api import coalescing_stats, connection_stats, hedge_stats, model_router, rate_limiter, upstream_scheduler
+from bot.keypool import ApiKey, key_pool
+from bot.handlers.messages import respond_to_button, show_history
+from bot.handlers.inline import inline_stats
 
 logger = logging.getLogger(__name__)
 
+def format_key_status(api_key: ApiKey) -> str:
+    """Render an API key's circuit breaker state for status messages."""
+    breaker = api_key.breaker
+    state = breaker.state
+    if state == breaker.CLOSED:
+        status = "✅ Online"
+    elif state == breaker.HALF_OPEN:
+        status = "⚠️ Recovering (testing)"
+    else:
+        status = f"❌ Offline (retry in {breaker.retry_in():.0f}s)"
+    
+    modes = ", ".join(sorted(api_key.modes)) or "any"
+    return f"<b>{api_key.name} ({modes}):</b> {status} · {api_key.outstanding} in flight"
+
+def format_key_pool_status() -> str:
+    """Render one status line per pooled API key."""
+    return "\n".join(format_key_status(api_key) for api_key in key_pool.keys)
+
 # === Command Handlers ===
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enhanced start command with interactive buttons and improved UI."""
@@ -44,10 +70,10 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         if update.message:
             await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='HTML')
         else:
-            await update.callback_query.edit_message_text(welcome_text, reply_markup=reply_markup, parse_mode='HTML')
-            
-        logger.info("Start command completed successfully")
+            await respond_to_button(update.callback_query, welcome_text, reply_markup=reply_markup, parse_mode='HTML')
         
+        logger.info("Start command completed successfully")
+    
     except Exception as e:
         logger.error(f"Error in start command: {str(e)}")
         error_msg = "Sorry, something went wrong. Please try again."
@@ -133,18 +159,99 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     session = get_user_session(user_id)
     session.last_interaction = datetime.now()
     
-    # Check API key status
-    api1_status = "✅ Online" if Config.api_status["key_01"] else "❌ Offline"
-    api2_status = "✅ Online" if Config.api_status["key_02"] else "❌ Offline"
-    
     status_text = (
         "📊 <b>Bot Status</b>\n\n"
-        f"<b>Deepseek (Free):</b> {api1_status}\n"
-        f"<b>Claude (Advanced):</b> {api2_status}\n\n"
+        f"{format_key_pool_status()}\n\n"
         f"<b>Total Users:</b> {len(get_user_session.__globals__['user_sessions'])}\n"
         f"<b>Total Prompts Generated:</b> {sum(len(session.history) for session in get_user_session.__globals__['user_sessions'].values())}\n"
         f"<b>Bot Uptime:</b> Since last restart\n\n"
-        "<i>Note: If an API key is offline, the bot will automatically use the working key for both modes.</i>"
     )
     
+    if Config.CACHE_ENABLED:
+        cache_stats = enhancement_cache.stats()
+        status_text += (
+            f"<b>Cache:</b> {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+            f"({cache_stats['hit_rate']:.1f}% hit rate, {cache_stats['size']} entries in memory)\n\n"
+        )
+    
+    if Config.SIMILARITY_ENABLED:
+        similarity_stats = similarity_index.stats()
+        status_text += (
+            f"<b>Near-Duplicate Reuse:</b> {similarity_stats['reuses']} of {similarity_stats['lookups']} cache misses "
+            f"({similarity_stats['reuse_rate']:.1f}%, avg similarity {similarity_stats['avg_similarity']:.2f}, "
+            f"threshold {Config.SIMILARITY_THRESHOLD:.2f})\n\n"
+        )
+    
+    if Config.INLINE_ENABLED:
+        status_text += (
+            f"<b>Inline Queries:</b> {inline_stats['queries']} received, {inline_stats['cache_hits']} from cache, "
+            f"{inline_stats['superseded']} superseded while typing, {inline_stats['upstream']} enhanced\n\n"
+        )
+    
+    status_text += (
+        f"<b>Upstream Calls:</b> {coalescing_stats['upstream']} "
+        f"({coalescing_stats['coalesced']} identical requests coalesced, "
+        f"{connection_stats['cold_requests']} on cold connections)\n\n"
+    )
+    
+    model_lines = []
+    for row in model_router.snapshot():
+        latency = f"p50 {row['p50']:.1f}s / p95 {row['p95']:.1f}s" if row['p95'] is not None else "no data yet"
+        model_lines.append(f"• {row['tier']}: {row['model']} — {latency}, {row['error_rate']:.0%} errors")
+    status_text += "<b>Models:</b>\n" + "\n".join(model_lines) + "\n\n"
+    
+    scheduler_stats = upstream_scheduler.stats()
+    lane_lines = "\n".join(
+        f"• {lane}: {lane_stats['queued']} waiting, p95 wait {lane_stats['wait_p95']:.1f}s"
+        for lane, lane_stats in scheduler_stats['lanes'].items()
+    )
+    status_text += (
+        f"<b>Upstream Queue:</b> {scheduler_stats['active']} running, {scheduler_stats['queued']} waiting\n"
+        f"{lane_lines}\n\n"
+    )
+    
+    if Config.RATE_LIMIT_ENABLED:
+        limiter_stats = rate_limiter.stats()
+        status_text += (
+            f"<b>Rate Limiting:</b> {limiter_stats['waiting']} queued, "
+            f"{limiter_stats['throttled']} delayed, {limiter_stats['rate_limited']} upstream 429s\n\n"
+        )
+    
+    update_queue = context.application.update_queue
+    status_text += (
+        f"<b>Incoming Updates:</b> {Config.UPDATE_MODE}, "
+        f"{update_queue.qsize()}/{Config.UPDATE_QUEUE_SIZE} queued\n\n"
+    )
+    
+    if Config.UPDATE_CONCURRENCY > 1:
+        processor_stats = update_processor.stats()
+        status_text += (
+            f"<b>Update Processing:</b> {processor_stats['running']}/{Config.UPDATE_CONCURRENCY} running, "
+            f"{processor_stats['waiting_on_user']} waiting on the same user's earlier updates, "
+            f"{processor_stats['contended']} contended ({processor_stats['contention_rate']:.1f}%), "
+            f"longest user queue {processor_stats['max_user_queue']}\n\n"
+        )
+    
+    if Config.TELEGRAM_RATE_LIMIT_ENABLED:
+        outbound_stats = outbound_limiter.stats()
+        status_text += (
+            f"<b>Telegram Outbound:</b> {outbound_stats['sent']} sent, {outbound_stats['waiting']} queued, "
+            f"{outbound_stats['coalesced_edits']} edits coalesced, {outbound_stats['retry_after']} flood waits, "
+            f"{outbound_stats['network_retries']} network retries\n\n"
+        )
+        call_rows = [row for row in call_metrics.summary(by="delivery") if row["stage"] == "enhancement"]
+        if call_rows:
+            status_text += "<b>Telegram Calls per Enhancement:</b> " + ", ".join(
+                f"{row['delivery'] or 'other'} {row['mean']:.1f} avg ({row['count']})" for row in call_rows
+            ) + "\n\n"
+    
+    if Config.HEDGE_ENABLED:
+        hedge_rate = (hedge_stats['hedged'] / hedge_stats['requests'] * 100) if hedge_stats['requests'] else 0
+        status_text += (
+            f"<b>Hedged Requests:</b> {hedge_stats['hedged']} ({hedge_rate:.1f}% of traffic), "
+            f"{hedge_stats['hedge_wins']} won, ~{hedge_stats['saved_seconds']:.1f}s saved\n\n"
+        )
+    
+    status_text += "<i>Note: If an API key is offline, the bot automatically moves its requests to the other working keys.</i>"
+    
     await update.message.reply_text(status_text, parse_mode='HTML')
\ No newline at end of file
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Optional, Tuple
+
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.error import BadRequest, TelegramError
+from telegram.ext import ContextTypes
+
+from bot.api import ask_openrouter
+from bot.cache import LRUCache, enhancement_cache, normalize_input
+from bot.config import Config
+from bot.deadline import Deadline
+from bot.models import get_user_session
+from bot.prompts import build_prompt
+from bot.utils import MESSAGE_LIMIT
+
+logger = logging.getLogger(__name__)
+
+# Results by normalized query text and model; Telegram caches answers for as long on its side
+inline_cache = LRUCache(Config.INLINE_CACHE_SIZE, Config.INLINE_CACHE_TTL)
+
+# The pending (debouncing or enhancing) query of each user; a newer query cancels it
+_pending: Dict[int, asyncio.Task] = {}
+
+inline_stats = {"queries": 0, "cache_hits": 0, "superseded": 0, "upstream": 0, "expired": 0}
+
+def _cache_key(text: str, model: str) -> str:
+    return f"{model}|{normalize_input(text)}"
+
+async def _answer(update: Update, text: str, result: Tuple[str, str]) -> None:
+    enhanced_prompt, model_used = result
+    article = InlineQueryResultArticle(
+        id=hashlib.sha256(f"{model_used}|{text}".encode("utf-8")).hexdigest()[:32],
+        title="✨ Enhanced prompt",
+        description=enhanced_prompt[:100],
+        input_message_content=InputTextMessageContent(enhanced_prompt[:MESSAGE_LIMIT])
+    )
+    try:
+        await update.inline_query.answer([article], cache_time=int(Config.INLINE_CACHE_TTL), is_personal=True)
+    except BadRequest as e:
+        # The user kept typing or gave up; the cached result serves the next identical query
+        inline_stats["expired"] += 1
+        logger.debug(f"Inline answer dropped: {e}")
+
+async def _enhance_after_pause(update: Update, text: str, model: str) -> None:
+    """Wait out the debounce interval, then enhance `text` and answer the query."""
+    user_id = update.inline_query.from_user.id
+    try:
+        await asyncio.sleep(Config.INLINE_DEBOUNCE)
+        
+        result = enhancement_cache.get(text, model) if Config.CACHE_ENABLED else None
+        if result is None:
+            inline_stats["upstream"] += 1
+            mode = "free" if model == Config.MODELS["free"] else "advanced"
+            # Telegram stops accepting answers after a few seconds
+            result = await ask_openrouter(build_prompt(text), model, mode, deadline=Deadline(Config.INLINE_DEADLINE))
+            if Config.CACHE_ENABLED:
+                enhancement_cache.set(text, model, *result)
+        inline_cache.set(_cache_key(text, model), result)
+        await _answer(update, text, result)
+    except asyncio.CancelledError:
+        raise
+    except TelegramError as e:
+        logger.warning(f"Inline query from user {user_id} failed: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error enhancing inline query from user {user_id}: {str(e)}")
+    finally:
+        if _pending.get(user_id) is asyncio.current_task():
+            del _pending[user_id]
+
+# === Inline Query Handler ===
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answer `@bot <idea>` with an enhanced prompt.
+    
+    Telegram sends a query for every pause in typing. Cached results are
+    answered at once; otherwise the enhancement starts only after the user
+    has stopped typing for Config.INLINE_DEBOUNCE seconds, and each new query
+    cancels the user's previous one, upstream call included (unless another
+    caller shares it), so a burst of keystrokes makes at most one upstream
+    call that runs to completion.
+    """
+    query = update.inline_query
+    user_id = query.from_user.id
+    text = query.query.strip()
+    inline_stats["queries"] += 1
+    
+    previous: Optional[asyncio.Task] = _pending.pop(user_id, None)
+    if previous is not None and not previous.done():
+        previous.cancel()
+        inline_stats["superseded"] += 1
+    
+    if len(text) < Config.INLINE_MIN_CHARS:
+        return
+    
+    model = get_user_session(user_id).preferred_model
+    cached = inline_cache.get(_cache_key(text, model))
+    if cached is not None:
+        inline_stats["cache_hits"] += 1
+        await _answer(update, text, cached)
+        return
+    
+    # Return right away so the user's next query isn't held behind this one
+    _pending[user_id] = context.application.create_task(_enhance_after_pause(update, text, model), update=update)
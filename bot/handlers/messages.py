@@ -1,17 +1,88 @@
+import asyncio
+import html
 import logging
+import time
 from datetime import datetime
-from typing import Dict
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from typing import Dict, Optional, Tuple
+from telegram import CallbackQuery, Message, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import TelegramError
 from telegram.ext import ContextTypes
 
-from bot.models import get_user_session
+from bot.models import UserSession, get_user_session
 from bot.prompts import build_prompt
 from bot.api import ask_openrouter
+from bot.cache import enhancement_cache
 from bot.config import Config
-from bot.utils.username import format_username, sanitize_username
+from bot.metrics import count_telegram_calls, stage_metrics
+from bot.similarity import similarity_index
+from bot.tokens import InputTooLongError
+from bot.utils import MESSAGE_LIMIT, format_username, sanitize_username, split_text
 
 logger = logging.getLogger(__name__)
 
+# Telegram rejects texts over 4096 characters; keep the live preview well below that
+STREAM_PREVIEW_LIMIT = 3500
+
+def make_progress_updater(progress_msg: Message):
+    """Build an `on_partial` callback that edits the progress message with streamed text.
+    
+    Edits are throttled to Config.STREAM_EDIT_INTERVAL to stay within Telegram's
+    per-chat limits; failed edits are ignored since the final result is sent anyway.
+    """
+    last_edit = 0.0
+    
+    async def on_partial(text: str) -> None:
+        nonlocal last_edit
+        now = time.monotonic()
+        if now - last_edit < Config.STREAM_EDIT_INTERVAL:
+            return
+        last_edit = now
+        
+        preview = text if len(text) <= STREAM_PREVIEW_LIMIT else "…" + text[-STREAM_PREVIEW_LIMIT:]
+        try:
+            await progress_msg.edit_text(f"✍️ Writing your enhanced prompt...\n\n{preview}")
+        except TelegramError as e:
+            logger.debug(f"Skipping progress edit: {e}")
+    
+    return on_partial
+
+async def reply_long_text(message: Message, text: str, filename: str) -> None:
+    """Reply with `text` as preformatted blocks split at natural boundaries.
+    
+    Texts over Config.DOCUMENT_THRESHOLD characters are sent as a single .txt
+    document instead of a long run of messages.
+    """
+    if len(text) > Config.DOCUMENT_THRESHOLD:
+        await message.reply_document(
+            document=text.encode("utf-8"),
+            filename=filename,
+            caption="📄 The result is long, so here it is as a file."
+        )
+        return
+    for chunk in split_text(text):
+        await message.reply_text(f"<pre>{html.escape(chunk)}</pre>", parse_mode='HTML')
+
+RESULT_TITLE = "Here's your enhanced prompt:"
+RESULT_HEADER = f"✅ <b>{RESULT_TITLE}</b>"
+HISTORY_PAGE_SIZE = 5
+NEXT_STEPS_TEXT = "🎯 <b>Put it this prompt in latest AI model for better and fruitful results | What would you like to do next?</b>"
+
+def is_result_message(message: Optional[Message]) -> bool:
+    """Whether `message` shows an enhanced prompt (compact replies put the buttons on it)."""
+    text = getattr(message, "text", None) or ""
+    return text.startswith(f"✅ {RESULT_TITLE}")
+
+async def respond_to_button(query: CallbackQuery, text: str, **kwargs) -> None:
+    """Edit the message a button was pressed on, or reply below it if it holds a result.
+    
+    With Config.COMPACT_REPLIES the result and its buttons share one message,
+    and editing that message would replace the prompt the user came for.
+    """
+    if is_result_message(query.message):
+        await query.message.reply_text(text, **kwargs)
+    else:
+        await query.edit_message_text(text, **kwargs)
+
 # === Message Handlers ===
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Enhanced message handler with progress updates and better error handling."""
@@ -33,65 +104,104 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Update last interaction time
     session.last_interaction = datetime.now()
     
-    # Send typing action to show the bot is working
-    await context.bot.send_chat_action(
-        chat_id=update.effective_chat.id,
-        action='typing'
-    )
+    # Per-stage timings go to stage_metrics, tagged with the model
+    model = session.preferred_model
+    started = time.monotonic()
     
-    try:
-        # Step 1: Acknowledge receipt
-        progress_msg = await update.message.reply_text(
-            "🔍 Analyzing your input...",
-            reply_to_message_id=update.message.message_id
-        )
-        
-        # Step 2: Determine mode based on preferred model
-        mode = "free" if session.preferred_model == Config.MODELS["free"] else "advanced"
-        
-        # Step 3: Generate enhanced prompt
-        messages = build_prompt(user_input)
-        enhanced_prompt, model_used = await ask_openrouter(messages, session.preferred_model, mode)
-        
-        # Step 4: Store in history
-        session.add_to_history(user_input, enhanced_prompt, model_used)
-        
-        # Step 5: Send results with formatting and options
-        await progress_msg.edit_text("✅ <b>Here's your enhanced prompt:</b>", parse_mode='HTML')
-        
-        # Split long messages to avoid Telegram's length limit
-        if len(enhanced_prompt) > 4000:
-            parts = [enhanced_prompt[i:i+4000] for i in range(0, len(enhanced_prompt), 4000)]
-            for part in parts:
-                await update.message.reply_text(f"```\n{part}\n```", parse_mode='Markdown')
-        else:
-            await update.message.reply_text(f"```\n{enhanced_prompt}\n```", parse_mode='Markdown')
-        
-        # Add action buttons
-        keyboard = [
-            [
-                InlineKeyboardButton("🔄 Improve Further", callback_data=f"improve:{user_id}"),
-                InlineKeyboardButton("📜 View History", callback_data='view_history')
-            ],
-            [InlineKeyboardButton("🏠 Main Menu", callback_data='back_to_main')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+    # Bot API calls made for this enhancement go to call_metrics, by delivery mode
+    with count_telegram_calls("enhancement", model=model) as call_labels:
+        # Send typing action to show the bot is working
+        with stage_metrics.timed("chat_action", model=model):
+            await context.bot.send_chat_action(
+                chat_id=update.effective_chat.id,
+                action='typing'
+            )
         
-        await update.message.reply_text(
-            "🎯 <b>Put it this prompt in latest AI model for better and fruitful results | What would you like to do next?</b>",
-            reply_markup=reply_markup,
-            parse_mode='HTML'
-        )
+        try:
+            # Step 1: Acknowledge receipt
+            with stage_metrics.timed("progress_reply", model=model):
+                progress_msg = await update.message.reply_text(
+                    "🔍 Analyzing your input...",
+                    reply_to_message_id=update.message.message_id
+                )
+            
+            # Step 2: Determine mode based on preferred model
+            mode = "free" if model == Config.MODELS["free"] else "advanced"
+            
+            # Step 3: Generate enhanced prompt
+            signature = None
+            with stage_metrics.timed("cache_lookup", model=model):
+                cached = enhancement_cache.get(user_input, model) if Config.CACHE_ENABLED else None
+                if cached is None and Config.SIMILARITY_ENABLED:
+                    # MinHash is pure Python; keep it off the event loop and compute it once
+                    signature = await asyncio.to_thread(similarity_index.signature, user_input)
+                    cached = similarity_index.lookup(user_input, model, signature)
+            if cached:
+                enhanced_prompt, model_used = cached
+            else:
+                with stage_metrics.timed("build_prompt", model=model):
+                    messages = build_prompt(user_input)
+                on_partial = make_progress_updater(progress_msg) if Config.STREAM_RESPONSES else None
+                priority = "admin" if user_id in Config.ADMIN_IDS else mode
+                with stage_metrics.timed("upstream", model=model) as labels:
+                    enhanced_prompt, model_used = await ask_openrouter(
+                        messages, model, mode, on_partial, priority=priority
+                    )
+                    labels["model"] = model_used
+                if Config.CACHE_ENABLED:
+                    enhancement_cache.set(user_input, model, enhanced_prompt, model_used)
+                if Config.SIMILARITY_ENABLED:
+                    similarity_index.add(user_input, model, enhanced_prompt, model_used, signature)
+            
+            # Step 4: Store in history
+            session.add_to_history(user_input, enhanced_prompt, model_used)
+            
+            # Step 5: Send results with formatting and options
+            keyboard = [
+                [
+                    InlineKeyboardButton("🔄 Improve Further", callback_data=f"improve:{user_id}"),
+                    InlineKeyboardButton("📜 View History", callback_data='view_history')
+                ],
+                [InlineKeyboardButton("🏠 Main Menu", callback_data='back_to_main')]
+            ]
+            reply_markup = InlineKeyboardMarkup(keyboard)
+            
+            if Config.COMPACT_REPLIES and len(RESULT_HEADER) + len(enhanced_prompt) + len(NEXT_STEPS_TEXT) + 4 <= MESSAGE_LIMIT:
+                # Result and buttons replace the progress message in a single edit
+                call_labels["delivery"] = "compact"
+                with stage_metrics.timed("result_edit", model=model):
+                    await progress_msg.edit_text(
+                        f"{RESULT_HEADER}\n\n<pre>{html.escape(enhanced_prompt)}</pre>\n\n{NEXT_STEPS_TEXT}",
+                        reply_markup=reply_markup,
+                        parse_mode='HTML'
+                    )
+            else:
+                call_labels["delivery"] = "full"
+                with stage_metrics.timed("progress_edit", model=model):
+                    await progress_msg.edit_text(RESULT_HEADER, parse_mode='HTML')
+                
+                # Split long messages to avoid Telegram's length limit
+                with stage_metrics.timed("result_replies", model=model):
+                    await reply_long_text(update.message, enhanced_prompt, "enhanced_prompt.txt")
+                
+                with stage_metrics.timed("keyboard_reply", model=model):
+                    await update.message.reply_text(NEXT_STEPS_TEXT, reply_markup=reply_markup, parse_mode='HTML')
+            stage_metrics.observe("total", time.monotonic() - started, model=model)
         
-    except Exception as e:
-        logger.error(f"Error processing message from user {user_id}: {str(e)}")
-        error_msg = (
-            "⚠️ <b>Oops! Something went wrong.</b>\n\n"
-            f"<i>Error: {str(e)}</i>\n\n"
-            "Try to switch different model if you are using advanced mode and it is asking for payment, but payment gateway is not available.\n\n"
-            "Please try again or use /help for assistance."
-        )
-        await update.message.reply_text(error_msg, parse_mode='HTML')
+        except InputTooLongError as e:
+            call_labels["delivery"] = "rejected"
+            logger.info(f"Rejected oversized input from user {user_id}: {str(e)}")
+            await progress_msg.edit_text(f"✂️ {str(e)}")
+        except Exception as e:
+            call_labels["delivery"] = "error"
+            logger.error(f"Error processing message from user {user_id}: {str(e)}")
+            error_msg = (
+                "⚠️ <b>Oops! Something went wrong.</b>\n\n"
+                f"<i>Error: {str(e)}</i>\n\n"
+                "Try to switch different model if you are using advanced mode and it is asking for payment, but payment gateway is not available.\n\n"
+                "Please try again or use /help for assistance."
+            )
+            await update.message.reply_text(error_msg, parse_mode='HTML')
 
 async def handle_feedback_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle feedback messages from users.
@@ -138,8 +248,53 @@ async def handle_feedback_message(update: Update, context: ContextTypes.DEFAULT_
         parse_mode='HTML'
     )
 
-async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Show the user's prompt history."""
+def render_history_page(session: UserSession, page: int) -> Tuple[str, int]:
+    """HTML for one page of the session's history (newest first) and the page count.
+    
+    Rendered pages are cached on the session until its history changes.
+    """
+    total_pages = max(1, -(-len(session.history) // HISTORY_PAGE_SIZE))
+    page = min(max(page, 0), total_pages - 1)
+    cached = session.history_pages.get(page)
+    if cached is not None:
+        return cached, total_pages
+    
+    newest_first = session.history[::-1]
+    first = page * HISTORY_PAGE_SIZE
+    history_text = f"📜 <b>Your Prompt History</b> (page {page + 1}/{total_pages})\n\n"
+    for i, item in enumerate(newest_first[first:first + HISTORY_PAGE_SIZE], first + 1):
+        timestamp = datetime.fromisoformat(item['timestamp']).strftime('%Y-%m-%d %H:%M')
+        model_used = item.get('model_used', 'unknown')
+        
+        history_text += (
+            f"<b>#{i}:</b>\n"
+            f"<i>📝 Original:</i> {html.escape(item['original'][:100])}{'...' if len(item['original']) > 100 else ''}\n"
+            f"<i>✨ Enhanced:</i> {html.escape(item['enhanced'][:100])}{'...' if len(item['enhanced']) > 100 else ''}\n"
+            f"<i>🤖 Model:</i> {html.escape(model_used)}\n"
+            f"<i>🕒 Time:</i> {timestamp}\n\n"
+        )
+    
+    session.history_pages[page] = history_text
+    return history_text, total_pages
+
+def history_keyboard(page: int, total_pages: int) -> InlineKeyboardMarkup:
+    """Newer / older buttons carrying the target page as `hist:<page>` callback data."""
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton("◀️ Newer", callback_data=f"hist:{page - 1}"))
+    if page < total_pages - 1:
+        navigation.append(InlineKeyboardButton("Older ▶️", callback_data=f"hist:{page + 1}"))
+    keyboard = [navigation] if navigation else []
+    keyboard.append([InlineKeyboardButton("🔙 Back to Main", callback_data='back_to_main')])
+    return InlineKeyboardMarkup(keyboard)
+
+async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0) -> None:
+    """Show one page of the user's prompt history.
+    
+    Commands get a new message; button presses edit the message they came
+    from, so paging through history costs one small edit per tap. A press on
+    a result message gets a new message so the result stays.
+    """
     try:
         user_id = update.effective_user.id
         session = get_user_session(user_id)
@@ -154,49 +309,17 @@ async def show_history(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
             if update.message:
                 await update.message.reply_text(message_text, reply_markup=reply_markup)
             else:
-                await update.callback_query.edit_message_text(message_text, reply_markup=reply_markup)
+                await respond_to_button(update.callback_query, message_text, reply_markup=reply_markup)
             return
         
-        history_text = "📜 <b>Your Prompt History:</b>\n\n"
-        for i, item in enumerate(reversed(session.history), 1):
-            timestamp = datetime.fromisoformat(item['timestamp']).strftime('%Y-%m-%d %H:%M')
-            model_used = item.get('model_used', 'unknown')
-            
-            history_text += (
-                f"<b>#{i}:</b>\n"
-                f"<i>📝 Original:</i> {item['original'][:100]}{'...' if len(item['original']) > 100 else ''}\n"
-                f"<i>✨ Enhanced:</i> {item['enhanced'][:100]}{'...' if len(item['enhanced']) > 100 else ''}\n"
-                f"<i>🤖 Model:</i> {model_used}\n"
-                f"<i>🕒 Time:</i> {timestamp}\n\n"
-            )
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back to Main", callback_data='back_to_main')]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        history_text, total_pages = render_history_page(session, page)
+        reply_markup = history_keyboard(min(max(page, 0), total_pages - 1), total_pages)
         
-        # Split long messages to avoid Telegram's length limit
-        if len(history_text) > 4000:
-            parts = [history_text[i:i+4000] for i in range(0, len(history_text), 4000)]
-            for i, part in enumerate(parts):
-                if i == len(parts) - 1:  # Last part
-                    if update.message:
-                        await update.message.reply_text(part, parse_mode='HTML', reply_markup=reply_markup)
-                    else:
-                        await update.callback_query.edit_message_text(part, parse_mode='HTML', reply_markup=reply_markup)
-                else:
-                    if update.message:
-                        await update.message.reply_text(part, parse_mode='HTML')
-                    else:
-                        await context.bot.send_message(
-                            chat_id=update.effective_chat.id,
-                            text=part,
-                            parse_mode='HTML'
-                        )
+        if update.message:
+            await update.message.reply_text(history_text, parse_mode='HTML', reply_markup=reply_markup)
         else:
-            if update.message:
-                await update.message.reply_text(history_text, parse_mode='HTML', reply_markup=reply_markup)
-            else:
-                await update.callback_query.edit_message_text(history_text, parse_mode='HTML', reply_markup=reply_markup)
-                
+            await respond_to_button(update.callback_query, history_text, parse_mode='HTML', reply_markup=reply_markup)
+    
     except Exception as e:
         logger.error(f"Error in show_history: {str(e)}")
         error_msg = "Sorry, couldn't load your history. Please try again."
@@ -1,3 +1,4 @@
+import html
 import logging
 from datetime import datetime, timedelta
 from typing import Dict, List, Set
@@ -6,6 +7,7 @@ from telegram.ext import ContextTypes
 
 from bot.database import feedback_db
 from bot.config import Config
+from bot.metrics import stage_metrics
 from bot.utils.username import sanitize_username
 
 logger = logging.getLogger(__name__)
@@ -80,4 +82,56 @@ async def feedback_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         
     except Exception as e:
         logger.error(f"Error generating feedback statistics: {e}")
-        await update.message.reply_text(f"⚠️ Error generating statistics: {str(e)}")
\ No newline at end of file
+        await update.message.reply_text(f"⚠️ Error generating statistics: {str(e)}")
+
+def _format_seconds(value) -> str:
+    if value is None:
+        return "-"
+    return f"{value * 1000:.0f}ms" if value < 1 else f"{value:.2f}s"
+
+async def latency_metrics(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Show per-stage latency percentiles (admin only).
+    
+    Usage: /metrics [model|key|reset]
+    """
+    user_id = update.effective_user.id
+    
+    # Check if user is an admin
+    if not hasattr(Config, 'ADMIN_IDS') or user_id not in Config.ADMIN_IDS:
+        await update.message.reply_text("⚠️ You don't have permission to use this command.")
+        logger.warning(f"Unauthorized access attempt to admin command by user {user_id}")
+        return
+    
+    try:
+        arg = context.args[0].lower() if context.args else None
+        if arg == "reset":
+            stage_metrics.reset()
+            await update.message.reply_text("✅ Latency metrics reset.")
+            return
+        
+        by = arg if arg in ("model", "key") else None
+        rows = [row for row in stage_metrics.summary(by=by) if not by or row[by]]
+        if not rows:
+            await update.message.reply_text("No latency data recorded yet.")
+            return
+        
+        lines = []
+        group = None
+        for row in rows:
+            if by and row[by] != group:
+                group = row[by]
+                lines.append(f"\n[{group}]")
+            lines.append(
+                f"{row['stage']:<16} n={row['count']:<5} p50={_format_seconds(row['p50']):>7} "
+                f"p95={_format_seconds(row['p95']):>7} p99={_format_seconds(row['p99']):>7}"
+            )
+        
+        title = f"⏱ <b>Stage Latency{f' by {by}' if by else ''}</b>"
+        # Stay under Telegram's message limit
+        body = html.escape("\n".join(lines).strip()[:3800])
+        await update.message.reply_text(f"{title}\n\n<pre>{body}</pre>", parse_mode='HTML')
+        logger.info(f"Latency metrics viewed by admin {user_id}")
+        
+    except Exception as e:
+        logger.error(f"Error generating latency metrics: {e}")
+        await update.message.reply_text(f"⚠️ Error generating metrics: {str(e)}")
@@ -0,0 +1,144 @@
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# === API Key Pool ===
+class ApiKey:
+    """An OpenRouter API key with its weight, mode affinity and health state."""
+    
+    def __init__(self, name: str, key: str, weight: int = 1, modes: Optional[Set[str]] = None):
+        self.name = name
+        self.key = key
+        self.weight = max(1, weight)
+        self.modes = modes or set()  # empty means "any mode"
+        self.breaker = Config.new_breaker(name)
+        self.outstanding = 0
+        self.total_requests = 0
+        self._current_weight = 0  # smooth weighted round-robin state
+    
+    def serves(self, mode: str) -> bool:
+        return not self.modes or mode in self.modes
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.breaker.snapshot(),
+            "weight": self.weight,
+            "modes": sorted(self.modes) or ["any"],
+            "outstanding": self.outstanding,
+            "total_requests": self.total_requests
+        }
+
+class NoApiKeyAvailable(Exception):
+    """Raised when every key is either excluded or has an open circuit breaker."""
+
+class KeyPool:
+    """Balances requests over N API keys.
+    
+    Keys with affinity for the requested mode are preferred; when none of them
+    is healthy any other healthy key is used. Among candidates the key is chosen
+    by least outstanding requests (relative to weight) or by smooth weighted
+    round-robin, depending on `strategy`.
+    """
+    
+    LEAST_OUTSTANDING = "least_outstanding"
+    WEIGHTED_ROUND_ROBIN = "weighted_round_robin"
+    
+    def __init__(self, keys: List[ApiKey], strategy: str = LEAST_OUTSTANDING):
+        if strategy not in (self.LEAST_OUTSTANDING, self.WEIGHTED_ROUND_ROBIN):
+            logger.warning(f"Unknown key selection strategy '{strategy}', using {self.LEAST_OUTSTANDING}")
+            strategy = self.LEAST_OUTSTANDING
+        self.keys = keys
+        self.strategy = strategy
+        self._rotation = 0  # tie-breaker so equal keys take turns
+    
+    @classmethod
+    def from_config(cls) -> "KeyPool":
+        """Build the pool from OPENROUTER_API_KEYS, falling back to the legacy 01/02 keys.
+        
+        OPENROUTER_API_KEYS is a comma-separated list of `key[:weight[:mode|mode]]`.
+        """
+        keys: List[ApiKey] = []
+        for index, entry in enumerate(Config.OPENROUTER_API_KEYS, 1):
+            parts = entry.split(":")
+            try:
+                weight = int(parts[1]) if len(parts) > 1 and parts[1] else 1
+            except ValueError:
+                weight = 0
+            if weight <= 0:
+                # The entry holds a secret, so only its position is reported
+                raise ValueError(f"OPENROUTER_API_KEYS entry {index}: weight must be a positive integer, got '{parts[1]}'")
+            modes = {m.strip() for m in parts[2].split("|") if m.strip()} if len(parts) > 2 else set()
+            keys.append(ApiKey(f"key_{index:02d}", parts[0].strip(), weight, modes))
+        
+        if not keys:
+            if Config.OPENROUTER_API_KEY_01:
+                keys.append(ApiKey("key_01", Config.OPENROUTER_API_KEY_01, modes={"free"}))
+            if Config.OPENROUTER_API_KEY_02:
+                keys.append(ApiKey("key_02", Config.OPENROUTER_API_KEY_02, modes={"advanced"}))
+        
+        return cls(keys, Config.OPENROUTER_KEY_STRATEGY)
+    
+    def _candidates(self, mode: str, exclude: Iterable[str]) -> List[ApiKey]:
+        excluded = set(exclude)
+        healthy = [k for k in self.keys if k.name not in excluded and k.breaker.is_available()]
+        preferred = [k for k in healthy if k.serves(mode)]
+        return preferred or healthy
+    
+    def has_available(self, mode: str, exclude: Iterable[str] = ()) -> bool:
+        return bool(self._candidates(mode, exclude))
+    
+    def acquire(self, mode: str, exclude: Iterable[str] = ()) -> ApiKey:
+        """Pick a key for a request; the caller must call `release` when done."""
+        candidates = self._candidates(mode, exclude)
+        if not candidates:
+            raise NoApiKeyAvailable("No API keys available")
+        
+        if self.strategy == self.WEIGHTED_ROUND_ROBIN:
+            chosen = self._pick_weighted_round_robin(candidates)
+        else:
+            chosen = self._pick_least_outstanding(candidates)
+        
+        if not chosen.serves(mode):
+            logger.warning(f"No healthy key for {mode} mode, using {chosen.name}")
+        
+        chosen.breaker.allow_request()
+        chosen.outstanding += 1
+        chosen.total_requests += 1
+        return chosen
+    
+    def release(self, api_key: ApiKey, success: Optional[bool]) -> None:
+        """Return a key to the pool and record the outcome (None = not the key's fault)."""
+        api_key.outstanding = max(0, api_key.outstanding - 1)
+        if success is True:
+            api_key.breaker.record_success()
+        elif success is False:
+            api_key.breaker.record_failure()
+    
+    def reset(self) -> None:
+        """Close all breakers (manual reset)."""
+        for api_key in self.keys:
+            api_key.breaker.reset()
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [api_key.snapshot() for api_key in self.keys]
+    
+    def _pick_least_outstanding(self, candidates: List[ApiKey]) -> ApiKey:
+        self._rotation += 1
+        offset = self._rotation % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        return min(rotated, key=lambda k: k.outstanding / k.weight)
+    
+    def _pick_weighted_round_robin(self, candidates: List[ApiKey]) -> ApiKey:
+        # Smooth weighted round-robin (as used by nginx): spreads heavy keys out evenly
+        total = sum(k.weight for k in candidates)
+        for api_key in candidates:
+            api_key._current_weight += api_key.weight
+        chosen = max(candidates, key=lambda k: k._current_weight)
+        chosen._current_weight -= total
+        return chosen
+
+# Create a singleton instance
+key_pool = KeyPool.from_config()
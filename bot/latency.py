@@ -0,0 +1,31 @@
+import math
+from collections import deque
+from typing import Optional
+
+# === Rolling Latency Window ===
+class LatencyWindow:
+    """Keeps the most recent `size` latency samples (seconds) for percentile queries."""
+    
+    def __init__(self, size: int = 200):
+        self._samples: deque = deque(maxlen=size)
+    
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+    
+    def __len__(self) -> int:
+        return len(self._samples)
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """Nearest-rank percentile (0-100), or None when no samples were recorded."""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(p / 100 * len(ordered)))
+        return ordered[rank - 1]
+    
+    def mean_above(self, threshold: float) -> Optional[float]:
+        """Mean of the samples slower than `threshold` (the expected latency of a slow request)."""
+        slow = [s for s in self._samples if s > threshold]
+        if not slow:
+            return None
+        return sum(slow) / len(slow)
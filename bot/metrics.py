@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# === Latency Histograms ===
+# Bucket upper bounds in seconds, from quick Telegram calls up to slow completions
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.35, 0.5, 0.75,
+    1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0
+)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Cumulative-bucket latency histogram (Prometheus style) with quantile estimates."""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate the q-quantile (0-1) by interpolating inside the bucket that contains it."""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= target:
+                if i == len(self.buckets):
+                    return self.max
+                lower = self.buckets[i - 1] if i else 0.0
+                return min(self.max, lower + (self.buckets[i] - lower) * (target - seen) / count)
+            seen += count
+        return self.max
+    
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+class StageMetrics:
+    """Per-stage latency histograms, labelled by model and API key where known."""
+    
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+    
+    def observe(self, stage: str, seconds: float, **labels: Optional[str]) -> None:
+        key = (stage, tuple(sorted((k, str(v)) for k, v in labels.items() if v)))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = Histogram(self.buckets)
+        histogram.observe(seconds)
+    
+    @contextmanager
+    def timed(self, stage: str, **labels: Optional[str]) -> Iterator[Dict[str, Optional[str]]]:
+        """Time the block as `stage`. Labels can still be filled in through the yielded dict."""
+        started = time.monotonic()
+        try:
+            yield labels
+        finally:
+            self.observe(stage, time.monotonic() - started, **labels)
+    
+    def reset(self) -> None:
+        self._histograms.clear()
+    
+    def summary(self, by: Optional[str] = None) -> List[Dict[str, Any]]:
+        """One row per stage (and per value of label `by`), merging all other labels."""
+        merged: Dict[Tuple[str, str], Histogram] = {}
+        for (stage, labels), histogram in self._histograms.items():
+            group = dict(labels).get(by, "") if by else ""
+            total = merged.get((stage, group))
+            if total is None:
+                total = merged[(stage, group)] = Histogram(self.buckets)
+            total.count += histogram.count
+            total.sum += histogram.sum
+            total.max = max(total.max, histogram.max)
+            total.counts = [a + b for a, b in zip(total.counts, histogram.counts)]
+        
+        return [
+            {
+                "stage": stage,
+                by or "group": group,
+                "count": histogram.count,
+                "mean": histogram.mean,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+                "p99": histogram.quantile(0.99)
+            }
+            for (stage, group), histogram in sorted(merged.items())
+        ]
+    
+    def render_prometheus(
+        self, name: str = "prompt_bot_stage_seconds", help_text: str = "Latency of each enhancement pipeline stage."
+    ) -> str:
+        """Text exposition format for scraping."""
+        lines = [
+            f"# HELP {name} {help_text}",
+            f"# TYPE {name} histogram"
+        ]
+        for (stage, labels), histogram in sorted(self._histograms.items()):
+            base = ",".join([f'stage="{stage}"'] + [f'{k}="{_escape(v)}"' for k, v in labels])
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{base},le="{le}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{base}}} {histogram.sum:.6f}")
+            lines.append(f"{name}_count{{{base}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+stage_metrics = StageMetrics()
+
+# === Telegram Call Counting ===
+CALL_COUNT_BUCKETS = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50)
+
+# Bot API calls per unit of work (e.g. one enhancement), as histograms of counts
+call_metrics = StageMetrics(CALL_COUNT_BUCKETS)
+
+# Counter of the innermost count_telegram_calls block; tasks started inside share it
+_call_counter: ContextVar[Optional[List[int]]] = ContextVar("telegram_call_counter", default=None)
+
+def record_telegram_call() -> None:
+    """Count one Bot API request against the enclosing count_telegram_calls block, if any."""
+    counter = _call_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+@contextmanager
+def count_telegram_calls(stage: str, **labels: Optional[str]) -> Iterator[Dict[str, Optional[str]]]:
+    """Record the Bot API calls made inside the block as `stage` in call_metrics.
+    
+    Labels can still be filled in through the yielded dict. Blocks that made
+    no calls (e.g. with outbound rate limiting, which does the counting, off)
+    are not recorded.
+    """
+    counter = [0]
+    token = _call_counter.set(counter)
+    try:
+        yield labels
+    finally:
+        _call_counter.reset(token)
+        if counter[0]:
+            call_metrics.observe(stage, counter[0], **labels)
+
+# === Metrics Endpoint ===
+class MetricsServer:
+    """Minimal local HTTP endpoint: /metrics (Prometheus text) and /metrics.json."""
+    
+    def __init__(self, metrics: StageMetrics, host: str, port: int, calls: Optional[StageMetrics] = None):
+        self.metrics = metrics
+        self.calls = calls
+        self.host = host
+        self.port = port
+        self._server: Optional[asyncio.AbstractServer] = None
+    
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+    
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers; the request body (if any) is ignored
+            while (await asyncio.wait_for(reader.readline(), timeout=5)).strip():
+                pass
+            
+            parts = request_line.decode("latin-1").split()
+            path = parts[1].split("?", 1)[0] if len(parts) > 1 else "/"
+            if path == "/metrics":
+                body = self.metrics.render_prometheus()
+                if self.calls is not None:
+                    body += self.calls.render_prometheus("prompt_bot_telegram_calls", "Bot API calls per unit of work.")
+                status, content_type = "200 OK", "text/plain; version=0.0.4"
+            elif path == "/metrics.json":
+                payload = {"stages": self.metrics.summary(), "by_model": self.metrics.summary(by="model")}
+                if self.calls is not None:
+                    payload["telegram_calls"] = self.calls.summary(by="delivery")
+                status, content_type, body = "200 OK", "application/json", json.dumps(payload)
+            else:
+                status, content_type, body = "404 Not Found", "text/plain", "Not found\n"
+            
+            raw = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(raw)}\r\nConnection: close\r\n\r\n".encode("latin-1") + raw
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError) as e:
+            logger.debug(f"Metrics request aborted: {e}")
+        finally:
+            writer.close()
@@ -10,6 +10,8 @@ class UserSession:
         self.preferred_model: str = Config.MODELS["free"]  # Default to free model
         self.last_interaction: datetime = datetime.now()
         self.feedback_history: List[Dict] = []
+        # Rendered history pages by page number; cleared whenever the history changes
+        self.history_pages: Dict[int, str] = {}
     
     def add_to_history(self, original: str, enhanced: str, model_used: str = None):
         """Add a new entry to the user's history"""
@@ -22,8 +24,14 @@ class UserSession:
         # Keep only the last 20 items
         if len(self.history) > 20:
             self.history = self.history[-20:]
+        self.history_pages.clear()
         self.last_interaction = datetime.now()
     
+    def clear_history(self):
+        """Remove all entries from the user's history"""
+        self.history = []
+        self.history_pages.clear()
+    
     def add_feedback(self, feedback: str, username: str = None):
         """Add feedback to user's feedback history and database"""
         # Add to in-memory storage
@@ -0,0 +1,207 @@
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, Hashable, Optional, Tuple, Union
+
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+from telegram.ext import BaseRateLimiter
+
+from bot.config import Config
+from bot.metrics import record_telegram_call
+from bot.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# === Outbound Telegram Rate Limiting ===
+# Calls that don't post anything into a chat only count against the global limit
+_UNLIMITED_PER_CHAT = {"sendChatAction", "answerCallbackQuery", "answerInlineQuery", "getChat", "getFile", "getMe"}
+# Safe to repeat after a timeout: repeating them can't produce a duplicate message
+_IDEMPOTENT = {
+    "editMessageText", "editMessageReplyMarkup", "editMessageCaption", "deleteMessage",
+    "sendChatAction", "answerCallbackQuery", "answerInlineQuery", "getChat", "getFile", "getMe"
+}
+_COALESCED = {"editMessageText"}
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    value = getattr(error, "_retry_after", None) or error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+class _PendingEdit:
+    """An edit still waiting for its turn; later edits of the same message replace its arguments."""
+    
+    def __init__(self, args: Any, kwargs: Dict[str, Any]):
+        self.args = args
+        self.kwargs = kwargs
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+class OutboundRateLimiter(BaseRateLimiter[int]):
+    """Throttles every Bot API call through a global and a per-chat token bucket.
+    
+    Requests for the same chat go out in order at the chat's rate; private and
+    group chats get separate limits. A RetryAfter pauses the affected chat (or
+    everything, for calls without a chat) and the call is retried; transient
+    network errors are retried with backoff, except timeouts of calls that could
+    post a message twice. Successive text edits of one message that are still
+    queued collapse into the latest one.
+    """
+    
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3.0,
+        max_retries: int = 3,
+        network_retries: int = 2
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_rate, "telegram")
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self.network_retries = network_retries
+        self._chat_buckets: Dict[Hashable, TokenBucket] = {}
+        self._pending_edits: Dict[Tuple[Hashable, Hashable], _PendingEdit] = {}
+        self.counters = {"sent": 0, "retry_after": 0, "network_retries": 0, "coalesced_edits": 0}
+    
+    async def initialize(self) -> None:
+        """Nothing to set up; buckets are created on demand."""
+    
+    async def shutdown(self) -> None:
+        self._chat_buckets.clear()
+    
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) > 1024:
+                # Forget chats whose buckets have fully refilled
+                for key, idle in list(self._chat_buckets.items()):
+                    if idle.is_idle():
+                        del self._chat_buckets[key]
+            # Negative ids (and @usernames) are groups and channels
+            is_group = isinstance(chat_id, str) or (isinstance(chat_id, int) and chat_id < 0)
+            if is_group:
+                bucket = TokenBucket(self.group_rate, self.group_burst, f"chat {chat_id}")
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst, f"chat {chat_id}")
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+    
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], list]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int]
+    ) -> Union[bool, Dict[str, Any], list]:
+        chat_id = data.get("chat_id")
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        
+        if endpoint in _COALESCED and chat_id is not None and data.get("message_id") is not None:
+            edit_key = (chat_id, data["message_id"])
+            pending = self._pending_edits.get(edit_key)
+            if pending is not None:
+                # Still queued: send only the newest text, once, and share its result
+                pending.args, pending.kwargs = args, kwargs
+                self.counters["coalesced_edits"] += 1
+                return await asyncio.shield(pending.future)
+            
+            pending = self._pending_edits[edit_key] = _PendingEdit(args, kwargs)
+            try:
+                await self._acquire(endpoint, chat_id)
+                # From here on, new edits of this message queue up behind this one
+                self._pending_edits.pop(edit_key, None)
+                result = await self._send(
+                    callback, pending.args, pending.kwargs, endpoint, chat_id, rate_limit_args, acquired=True
+                )
+            except asyncio.CancelledError:
+                self._pending_edits.pop(edit_key, None)
+                pending.future.cancel()
+                raise
+            except Exception as e:
+                self._pending_edits.pop(edit_key, None)
+                pending.future.set_exception(e)
+                pending.future.exception()  # retrieved here in case nobody else waits
+                raise
+            pending.future.set_result(result)
+            return result
+        
+        return await self._send(callback, args, kwargs, endpoint, chat_id, rate_limit_args)
+    
+    async def _acquire(self, endpoint: str, chat_id: Optional[Hashable]) -> None:
+        # Per-chat first, so a chat waiting on its own limit doesn't hold up the global queue
+        if chat_id is not None and endpoint not in _UNLIMITED_PER_CHAT:
+            await self._chat_bucket(chat_id).acquire()
+        await self.global_bucket.acquire()
+    
+    async def _send(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        chat_id: Optional[Hashable],
+        rate_limit_args: Optional[int],
+        acquired: bool = False
+    ) -> Any:
+        max_retries = self.max_retries if rate_limit_args is None else rate_limit_args
+        flood_retries = 0
+        network_retries = 0
+        while True:
+            if not acquired:
+                await self._acquire(endpoint, chat_id)
+            acquired = False
+            try:
+                record_telegram_call()
+                result = await callback(*args, **kwargs)
+                self.counters["sent"] += 1
+                return result
+            except RetryAfter as e:
+                self.counters["retry_after"] += 1
+                if flood_retries >= max_retries:
+                    logger.error(f"Telegram flood limit on {endpoint} after {flood_retries} retries")
+                    raise
+                flood_retries += 1
+                wait = _retry_after_seconds(e) + 0.1
+                logger.warning(f"Telegram flood limit on {endpoint} (chat {chat_id}), pausing {wait:.1f}s")
+                if chat_id is not None and endpoint not in _UNLIMITED_PER_CHAT:
+                    self._chat_bucket(chat_id).block_for(wait)
+                else:
+                    self.global_bucket.block_for(wait)
+            except BadRequest:
+                raise
+            except NetworkError as e:
+                retryable = not isinstance(e, TimedOut) or endpoint in _IDEMPOTENT
+                if not retryable or network_retries >= self.network_retries:
+                    raise
+                self.counters["network_retries"] += 1
+                delay = 0.5 * 2 ** network_retries
+                network_retries += 1
+                logger.warning(f"Telegram network error on {endpoint}, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+    
+    def stats(self) -> Dict[str, int]:
+        buckets = [self.global_bucket, *self._chat_buckets.values()]
+        return {
+            **self.counters,
+            "throttled": sum(b.throttled for b in buckets),
+            "waiting": sum(b.waiting for b in self._chat_buckets.values()) + self.global_bucket.waiting,
+            "chats": len(self._chat_buckets)
+        }
+
+# Create a singleton instance
+outbound_limiter = OutboundRateLimiter(
+    global_rate=Config.TELEGRAM_GLOBAL_RATE,
+    chat_rate=Config.TELEGRAM_CHAT_RATE,
+    chat_burst=Config.TELEGRAM_CHAT_BURST,
+    group_rate=Config.TELEGRAM_GROUP_RATE / 60,
+    max_retries=Config.TELEGRAM_MAX_RETRIES,
+    network_retries=Config.TELEGRAM_NETWORK_RETRIES
+)
@@ -0,0 +1,65 @@
+import json
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List
+
+from bot.prompts import SYSTEM_MESSAGE
+
+logger = logging.getLogger(__name__)
+
+# === JSON Codec ===
+# orjson is optional; it is several times faster than the standard library
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact UTF-8 JSON."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def loads(raw: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+# === Request Body Templates ===
+class RequestTemplate:
+    """Chat completion body for one model with the static parts serialized once.
+    
+    The model, sampling parameters and system message are encoded up front;
+    `render` only splices in the remaining messages and the per-request fields.
+    """
+    
+    def __init__(self, model: str, temperature: float):
+        self.model = model
+        self.temperature = temperature
+        self._head = (
+            b'{"model":' + dumps(model)
+            + b',"temperature":' + dumps(temperature)
+            + b',"messages":[' + dumps(SYSTEM_MESSAGE)
+        )
+    
+    def render(self, messages: List[Dict], max_tokens: int, stream: bool = False) -> bytes:
+        """Body for `messages`, whose first entry must be SYSTEM_MESSAGE."""
+        parts = [self._head]
+        for message in messages[1:]:
+            parts.append(b"," + dumps(message))
+        parts.append(b'],"max_tokens":' + str(int(max_tokens)).encode("ascii"))
+        if stream:
+            parts.append(b',"stream":true')
+        parts.append(b"}")
+        return b"".join(parts)
+
+@lru_cache(maxsize=32)
+def template_for(model: str, temperature: float) -> RequestTemplate:
+    return RequestTemplate(model, temperature)
+
+def encode_body(data: Dict[str, Any], stream: bool = False) -> bytes:
+    """Serialize a request body, using the model's template when it fits."""
+    messages = data["messages"]
+    if set(data) == {"model", "messages", "temperature", "max_tokens"} and messages and messages[0] == SYSTEM_MESSAGE:
+        return template_for(data["model"], data["temperature"]).render(messages, data["max_tokens"], stream)
+    return dumps({**data, "stream": True} if stream else data)
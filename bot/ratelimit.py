@@ -0,0 +1,200 @@
+import asyncio
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# === Token Bucket ===
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`.
+    
+    `acquire` queues callers (FIFO) until a token is available instead of failing,
+    and `block_for` pauses the bucket entirely, e.g. after a 429 with Retry-After.
+    """
+    
+    def __init__(self, rate: float, capacity: float, name: str = ""):
+        self.name = name
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+        self.waiting = 0
+        self.throttled = 0  # acquisitions that had to wait
+    
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+    
+    def _wait_time(self, tokens: float) -> float:
+        self._refill()
+        now = time.monotonic()
+        if now < self._blocked_until:
+            return self._blocked_until - now
+        if self._tokens >= tokens:
+            return 0.0
+        if self.rate <= 0:
+            return 1.0
+        return (tokens - self._tokens) / self.rate
+    
+    async def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> None:
+        """Wait for `tokens`; raises asyncio.TimeoutError if that takes longer than `timeout`."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self.waiting += 1
+        try:
+            # The caller ahead may sleep past our deadline, so the deadline applies in line too
+            if deadline is None:
+                await self._lock.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(self._lock.acquire(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    raise asyncio.TimeoutError(f"Rate limit queue for {self.name or 'bucket'} exceeds deadline") from None
+            try:
+                waited = False
+                while True:
+                    wait = self._wait_time(tokens)
+                    if wait <= 0:
+                        self._tokens -= tokens
+                        if waited:
+                            self.throttled += 1
+                        return
+                    if deadline is not None and time.monotonic() + wait > deadline:
+                        raise asyncio.TimeoutError(f"Rate limit wait for {self.name or 'bucket'} exceeds deadline")
+                    waited = True
+                    await asyncio.sleep(wait)
+            finally:
+                self._lock.release()
+        finally:
+            self.waiting -= 1
+    
+    def refund(self, tokens: float = 1.0) -> None:
+        """Return tokens taken for a request that was never sent."""
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + tokens)
+    
+    def block_for(self, seconds: float) -> None:
+        """Stop handing out tokens for `seconds`; afterwards only one request may go first."""
+        self._refill()
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+        self._tokens = min(self._tokens, 1.0)
+    
+    def is_idle(self) -> bool:
+        """Full, unblocked and unused: forgetting the bucket changes nothing."""
+        self._refill()
+        return not self.waiting and self._tokens >= self.capacity and time.monotonic() >= self._blocked_until
+    
+    def limit_remaining(self, remaining: int, reset_in: Optional[float]) -> None:
+        """Align the bucket with the server's view of the remaining quota."""
+        self._refill()
+        self._tokens = min(self._tokens, float(remaining))
+        if remaining <= 0 and reset_in:
+            self.block_for(reset_in)
+
+# === Header Parsing ===
+def _parse_reset(value: str) -> Optional[float]:
+    """Turn a reset header (delta seconds, epoch seconds or epoch ms) into seconds from now."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if number > 1e12:  # epoch milliseconds (OpenRouter)
+        return max(0.0, number / 1000 - time.time())
+    if number > 1e9:  # epoch seconds
+        return max(0.0, number - time.time())
+    return max(0.0, number)
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to Retry-After or X-RateLimit-Reset, if present."""
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = headers.get("x-ratelimit-reset")
+    return _parse_reset(reset) if reset else None
+
+# === Upstream Rate Limiter ===
+class RateLimiter:
+    """Per-key and per-model token buckets in front of upstream calls."""
+    
+    def __init__(self, key_rate: float, key_burst: float, model_rate: float, model_burst: float, default_retry_after: float = 10.0):
+        self.key_rate = key_rate
+        self.key_burst = key_burst
+        self.model_rate = model_rate
+        self.model_burst = model_burst
+        self.default_retry_after = default_retry_after
+        self.key_buckets: Dict[str, TokenBucket] = {}
+        self.model_buckets: Dict[str, TokenBucket] = {}
+        self.rate_limited = 0  # 429 responses seen
+    
+    def bucket_for_key(self, key_name: str) -> Optional[TokenBucket]:
+        if self.key_rate <= 0:
+            return None
+        if key_name not in self.key_buckets:
+            self.key_buckets[key_name] = TokenBucket(self.key_rate, self.key_burst, key_name)
+        return self.key_buckets[key_name]
+    
+    def bucket_for_model(self, model: str) -> Optional[TokenBucket]:
+        if self.model_rate <= 0:
+            return None
+        if model not in self.model_buckets:
+            self.model_buckets[model] = TokenBucket(self.model_rate, self.model_burst, model)
+        return self.model_buckets[model]
+    
+    async def acquire(self, key_name: str, model: str, timeout: Optional[float] = None) -> None:
+        """Queue until both the key's and the model's bucket allow a request."""
+        started = time.monotonic()
+        key_bucket = self.bucket_for_key(key_name)
+        if key_bucket:
+            await key_bucket.acquire(timeout=timeout)
+        model_bucket = self.bucket_for_model(model)
+        if model_bucket:
+            remaining = None if timeout is None else max(0.0, timeout - (time.monotonic() - started))
+            try:
+                await model_bucket.acquire(timeout=remaining)
+            except BaseException:
+                # The request never goes out, so the key's token wasn't used
+                if key_bucket:
+                    key_bucket.refund()
+                raise
+    
+    def observe(self, key_name: str, headers: Mapping[str, str]) -> None:
+        """Adjust the key's bucket from X-RateLimit-* headers on any response."""
+        remaining = headers.get("x-ratelimit-remaining")
+        bucket = self.bucket_for_key(key_name)
+        if remaining is None or bucket is None:
+            return
+        try:
+            bucket.limit_remaining(int(float(remaining)), _parse_reset(headers.get("x-ratelimit-reset", "")))
+        except ValueError:
+            pass
+    
+    def on_rate_limited(self, key_name: str, model: str, headers: Mapping[str, str]) -> float:
+        """Pause the buckets involved in a 429 and return the wait in seconds."""
+        self.rate_limited += 1
+        retry_after = parse_retry_after(headers)
+        if retry_after is None:
+            retry_after = self.default_retry_after
+        logger.warning(f"Rate limited on {key_name} / {model}, backing off {retry_after:.1f}s")
+        
+        for bucket in (self.bucket_for_key(key_name), self.bucket_for_model(model)):
+            if bucket:
+                bucket.block_for(retry_after)
+        return retry_after
+    
+    def stats(self) -> Dict[str, int]:
+        buckets = list(self.key_buckets.values()) + list(self.model_buckets.values())
+        return {
+            "rate_limited": self.rate_limited,
+            "throttled": sum(b.throttled for b in buckets),
+            "waiting": sum(b.waiting for b in buckets)
+        }
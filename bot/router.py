@@ -0,0 +1,140 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional
+
+from bot.latency import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+# === Model Routing ===
+class ModelHealth:
+    """Rolling latency, time to first token and error rate for one model."""
+    
+    def __init__(self, window_size: int = 50):
+        self.window_size = window_size
+        self.latency = LatencyWindow(window_size)
+        self.first_token = LatencyWindow(window_size)  # streamed requests only
+        self._outcomes: deque = deque(maxlen=window_size)
+        self.updated_at = time.monotonic()
+    
+    def record(self, success: bool, latency: Optional[float] = None) -> None:
+        self.updated_at = time.monotonic()
+        self._outcomes.append(success)
+        if success and latency is not None:
+            self.latency.add(latency)
+    
+    @property
+    def samples(self) -> int:
+        return len(self._outcomes)
+    
+    @property
+    def error_rate(self) -> float:
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+    
+    def forget(self) -> None:
+        self.latency = LatencyWindow(self.window_size)
+        self.first_token = LatencyWindow(self.window_size)
+        self._outcomes.clear()
+
+class ModelRouter:
+    """Routes each request to the healthiest model of its tier.
+    
+    Every tier has an ordered list of candidate models. Models whose error rate is
+    above `max_error_rate` go last; the rest are ranked by p95 latency weighted by
+    error rate, with models we know too little about assumed to be as good as the
+    best known one (so configured order decides). Unhealthy models are forgotten
+    after `probe_interval` seconds without traffic so they get probed again. The
+    ranking doubles as the fallback chain for retries.
+    """
+    
+    def __init__(
+        self,
+        tiers: Dict[str, List[str]],
+        min_samples: int = 5,
+        max_error_rate: float = 0.3,
+        window_size: int = 50,
+        probe_interval: float = 60.0
+    ):
+        self.tiers = tiers
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.window_size = window_size
+        self.probe_interval = probe_interval
+        self._health: Dict[str, ModelHealth] = {}
+    
+    def health(self, model: str) -> ModelHealth:
+        if model not in self._health:
+            self._health[model] = ModelHealth(self.window_size)
+        return self._health[model]
+    
+    def tier_for(self, model: str) -> Optional[str]:
+        for tier, models in self.tiers.items():
+            if model in models:
+                return tier
+        return None
+    
+    def rank(self, model: str) -> List[str]:
+        """Candidates for the tier `model` belongs to, healthiest first."""
+        tier = self.tier_for(model)
+        if tier is None:
+            return [model]
+        
+        now = time.monotonic()
+        scores: Dict[str, Optional[float]] = {}
+        unhealthy = set()
+        for candidate in self.tiers[tier]:
+            health = self.health(candidate)
+            if health.samples >= self.min_samples and health.error_rate > self.max_error_rate:
+                if now - health.updated_at < self.probe_interval:
+                    unhealthy.add(candidate)
+                    scores[candidate] = health.error_rate
+                    continue
+                health.forget()
+            p95 = health.latency.percentile(95)
+            if health.samples < self.min_samples or p95 is None:
+                scores[candidate] = None
+            else:
+                scores[candidate] = p95 * (1 + health.error_rate)
+        
+        known = [score for c, score in scores.items() if score is not None and c not in unhealthy]
+        prior = min(known) if known else 0.0
+        
+        def sort_key(item):
+            order, candidate = item
+            score = scores[candidate]
+            return (candidate in unhealthy, prior if score is None else score, order)
+        
+        return [candidate for _, candidate in sorted(enumerate(self.tiers[tier]), key=sort_key)]
+    
+    def pick(self, model: str, exclude: Iterable[str] = ()) -> str:
+        """Best candidate not in `exclude`; falls back to the best overall."""
+        ranked = self.rank(model)
+        excluded = set(exclude)
+        for candidate in ranked:
+            if candidate not in excluded:
+                return candidate
+        return ranked[0]
+    
+    def record(self, model: str, success: bool, latency: Optional[float] = None) -> None:
+        self.health(model).record(success, latency)
+    
+    def record_first_token(self, model: str, seconds: float) -> None:
+        self.health(model).first_token.add(seconds)
+    
+    def snapshot(self) -> List[Dict[str, Any]]:
+        rows = []
+        for tier, models in self.tiers.items():
+            for model in models:
+                health = self.health(model)
+                rows.append({
+                    "tier": tier,
+                    "model": model,
+                    "samples": health.samples,
+                    "error_rate": health.error_rate,
+                    "p50": health.latency.percentile(50),
+                    "p95": health.latency.percentile(95)
+                })
+        return rows
@@ -0,0 +1,128 @@
+import asyncio
+import itertools
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from bot.latency import LatencyWindow
+
+logger = logging.getLogger(__name__)
+
+# === Upstream Scheduler ===
+class _Waiter:
+    def __init__(self, lane: str, priority: int, model: str, seq: int, future: asyncio.Future):
+        self.lane = lane
+        self.priority = priority
+        self.model = model
+        self.seq = seq
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+class UpstreamScheduler:
+    """Bounded-concurrency gate for upstream calls with priority lanes.
+    
+    At most `max_concurrency` calls run at once, and at most the model's cap per
+    model. Waiting calls are released lane by lane (admin, then advanced, then
+    free); every `aging_seconds` spent waiting promotes a call by one lane so
+    lower lanes can't starve under sustained load.
+    """
+    
+    LANES = {"admin": 0, "advanced": 1, "free": 2}
+    
+    def __init__(
+        self,
+        max_concurrency: int,
+        default_model_limit: int,
+        model_limits: Optional[Dict[str, int]] = None,
+        aging_seconds: float = 10.0
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.default_model_limit = max(1, default_model_limit)
+        self.model_limits = model_limits or {}
+        self.aging_seconds = aging_seconds
+        
+        self.active = 0
+        self.active_by_model: Dict[str, int] = {}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self.wait_times: Dict[str, LatencyWindow] = {lane: LatencyWindow() for lane in self.LANES}
+    
+    def _model_limit(self, model: str) -> int:
+        return self.model_limits.get(model, self.default_model_limit)
+    
+    def _has_capacity(self, model: str) -> bool:
+        return (
+            self.active < self.max_concurrency
+            and self.active_by_model.get(model, 0) < self._model_limit(model)
+        )
+    
+    def _take(self, model: str) -> None:
+        self.active += 1
+        self.active_by_model[model] = self.active_by_model.get(model, 0) + 1
+    
+    def _effective_priority(self, waiter: _Waiter, now: float) -> float:
+        aged = (now - waiter.enqueued_at) / self.aging_seconds if self.aging_seconds > 0 else 0
+        return waiter.priority - aged
+    
+    async def acquire(self, lane: str, model: str, timeout: Optional[float] = None) -> None:
+        """Wait for a slot; raises asyncio.TimeoutError if none frees up within `timeout`."""
+        lane = lane if lane in self.LANES else "free"
+        if not self._waiters and self._has_capacity(model):
+            self._take(model)
+            self.wait_times[lane].add(0.0)
+            return
+        
+        future = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(lane, self.LANES[lane], model, next(self._seq), future)
+        self._waiters.append(waiter)
+        # Another model may still have room even though this lane is backed up
+        self._dispatch()
+        try:
+            await asyncio.wait_for(future, timeout)
+        except BaseException:
+            if future.done() and not future.cancelled():
+                # Granted a slot just as we gave up: hand it back
+                self.release(model)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        self.wait_times[lane].add(time.monotonic() - waiter.enqueued_at)
+    
+    def try_acquire(self, model: str) -> bool:
+        """Take a slot only if one is free now and no call is queued; never waits."""
+        if self._waiters or not self._has_capacity(model):
+            return False
+        self._take(model)
+        return True
+    
+    def release(self, model: str) -> None:
+        self.active = max(0, self.active - 1)
+        self.active_by_model[model] = max(0, self.active_by_model.get(model, 0) - 1)
+        self._dispatch()
+    
+    def _dispatch(self) -> None:
+        while self._waiters and self.active < self.max_concurrency:
+            now = time.monotonic()
+            eligible = [w for w in self._waiters if self._has_capacity(w.model)]
+            if not eligible:
+                return
+            waiter = min(eligible, key=lambda w: (self._effective_priority(w, now), w.seq))
+            self._waiters.remove(waiter)
+            if waiter.future.done():
+                continue
+            self._take(waiter.model)
+            waiter.future.set_result(None)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": len(self._waiters),
+            "lanes": {
+                lane: {
+                    "queued": sum(1 for w in self._waiters if w.lane == lane),
+                    "wait_p50": self.wait_times[lane].percentile(50) or 0.0,
+                    "wait_p95": self.wait_times[lane].percentile(95) or 0.0
+                }
+                for lane in self.LANES
+            }
+        }
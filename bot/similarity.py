@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from bot.config import Config
+
+logger = logging.getLogger(__name__)
+
+# === Near-Duplicate Detection ===
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+_PRIME = (1 << 61) - 1
+# Tokens that change what a prompt asks for while barely moving its shingles ("30 days" vs "90 days")
+_SALIENT = re.compile(r"\d+(?:[.,]\d+)*|\b(?:no|not|never|none|nor|neither|without|cannot|nothing|\w+n't)\b")
+
+def salient_tokens(text: str) -> Tuple[str, ...]:
+    """Numbers and negations of the text in order; near-duplicates are reused only if these match."""
+    return tuple(_SALIENT.findall(text.lower().replace("\u2019", "'")))
+
+def shingles(text: str, size: int) -> Set[str]:
+    """Character shingles of the text with case, punctuation and spacing normalized away."""
+    normalized = _NON_WORD.sub(" ", text.lower()).strip()
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+class _Entry:
+    __slots__ = ("key", "model", "signature", "salient", "value", "created_at")
+    
+    def __init__(self, key: str, model: str, signature: Tuple[int, ...], salient: Tuple[str, ...], value: Tuple[str, str]):
+        self.key = key
+        self.model = model
+        self.signature = signature
+        self.salient = salient
+        self.value = value
+        self.created_at = time.time()
+
+class SimilarityIndex:
+    """MinHash / LSH index of recent inputs for reusing near-duplicate enhancements.
+    
+    Each input is reduced to a MinHash signature of `bands * rows` values; inputs
+    sharing any band are candidates, and a candidate is reused when the share of
+    equal signature values (an estimate of Jaccard similarity) reaches
+    `threshold` and both inputs have the same numbers and negations. At most
+    `max_entries` inputs are kept, least recently used first out, and entries
+    expire after `ttl` seconds. Inputs over `max_chars` characters are not
+    indexed.
+    
+    Signatures cost milliseconds per kilobyte of input, so callers compute one
+    with `signature` (off the event loop) and pass it to `lookup` and `add`.
+    """
+    
+    def __init__(
+        self,
+        threshold: float,
+        max_entries: int,
+        ttl: float,
+        bands: int = 16,
+        rows: int = 4,
+        shingle_size: int = 4,
+        max_chars: int = 4000
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+        self.max_chars = max_chars
+        
+        # Fixed seed so signatures are comparable across restarts
+        rng = random.Random(0x5EED)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(bands * rows)]
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._buckets: List[Dict[Tuple[int, ...], Set[str]]] = [{} for _ in range(bands)]
+        
+        self.lookups = 0
+        self.reuses = 0
+        self.similarity_sum = 0.0
+    
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """MinHash signature of the text, or None if it is empty or too long to index."""
+        if len(text) > self.max_chars:
+            return None
+        grams = shingles(text, self.shingle_size)
+        if not grams:
+            return None
+        hashes = [
+            int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+            for gram in grams
+        ]
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms)
+    
+    def _bands_of(self, signature: Tuple[int, ...]) -> List[Tuple[int, ...]]:
+        return [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+    
+    @staticmethod
+    def _key(text: str, model: str) -> str:
+        normalized = _NON_WORD.sub(" ", text.lower()).strip()
+        return hashlib.sha256(f"{model}|{normalized}".encode("utf-8")).hexdigest()
+    
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for bucket, band in zip(self._buckets, self._bands_of(entry.signature)):
+            members = bucket.get(band)
+            if members is not None:
+                members.discard(key)
+                if not members:
+                    del bucket[band]
+    
+    def lookup(self, text: str, model: str, signature: Optional[Tuple[int, ...]]) -> Optional[Tuple[str, str]]:
+        """Return (enhanced_text, model_used) of the most similar recent input, if similar enough.
+        
+        `signature` is `self.signature(text)`.
+        """
+        self.lookups += 1
+        if signature is None:
+            return None
+        salient = salient_tokens(text)
+        
+        candidates: Set[str] = set()
+        for bucket, band in zip(self._buckets, self._bands_of(signature)):
+            candidates |= bucket.get(band, set())
+        
+        now = time.time()
+        best: Optional[_Entry] = None
+        best_similarity = 0.0
+        for key in candidates:
+            entry = self._entries.get(key)
+            if entry is None or entry.model != model or entry.salient != salient:
+                continue
+            if now - entry.created_at > self.ttl:
+                self._remove(key)
+                continue
+            similarity = sum(x == y for x, y in zip(signature, entry.signature)) / len(signature)
+            if similarity > best_similarity:
+                best, best_similarity = entry, similarity
+        
+        if best is None or best_similarity < self.threshold:
+            return None
+        
+        self._entries.move_to_end(best.key)
+        self.reuses += 1
+        self.similarity_sum += best_similarity
+        logger.info(f"Reusing near-duplicate enhancement (similarity {best_similarity:.2f})")
+        return best.value
+    
+    def add(
+        self,
+        text: str,
+        model: str,
+        enhanced_text: str,
+        model_used: str,
+        signature: Optional[Tuple[int, ...]]
+    ) -> None:
+        """Index an enhancement; `signature` is `self.signature(text)`."""
+        if signature is None:
+            return
+        key = self._key(text, model)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        
+        self._entries[key] = _Entry(key, model, signature, salient_tokens(text), (enhanced_text, model_used))
+        for bucket, band in zip(self._buckets, self._bands_of(signature)):
+            bucket.setdefault(band, set()).add(key)
+        
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+    
+    def clear(self) -> None:
+        self._entries.clear()
+        self._buckets = [{} for _ in range(self.bands)]
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "lookups": self.lookups,
+            "reuses": self.reuses,
+            "reuse_rate": (self.reuses / self.lookups * 100) if self.lookups else 0.0,
+            "avg_similarity": (self.similarity_sum / self.reuses) if self.reuses else 0.0,
+            "size": len(self._entries)
+        }
+
+# Create a singleton instance
+similarity_index = SimilarityIndex(
+    threshold=Config.SIMILARITY_THRESHOLD,
+    max_entries=Config.SIMILARITY_MAX_ENTRIES,
+    ttl=Config.CACHE_TTL,
+    bands=Config.SIMILARITY_BANDS,
+    rows=Config.SIMILARITY_ROWS
+)
@@ -5,12 +5,17 @@ from telegram.ext import ContextTypes
 from bot.models import user_sessions
 from bot.config import Config
 from bot.database import feedback_db
+from bot.cache import enhancement_cache
+from bot.similarity import similarity_index
+from bot.keypool import key_pool
+from bot.api import keep_connections_warm
+from bot.updates import update_processor
 
 logger = logging.getLogger(__name__)
 
 # === Periodic Tasks ===
 async def periodic_cleanup(context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Periodic cleanup task to remove old sessions and reset API status."""
+    """Periodic cleanup task to remove old sessions and report API key health."""
     try:
         current_time = datetime.now()
         
@@ -24,8 +29,37 @@ async def periodic_cleanup(context: ContextTypes.DEFAULT_TYPE) -> None:
             del user_sessions[user_id]
             logger.info(f"Removed inactive user session: {user_id}")
         
-        # Reset API status every hour (in case of temporary issues)
-        Config.reset_api_status()
+        # Log API key breaker states (recovery is handled by half-open probing)
+        for snapshot in key_pool.snapshot():
+            logger.info(
+                f"API {snapshot['name']} breaker: {snapshot['state']}, "
+                f"error rate {snapshot['error_rate']:.0%}, {snapshot['total_requests']} requests"
+            )
+        
+        # Drop expired entries from the persistent enhancement cache
+        if Config.CACHE_ENABLED:
+            purged = enhancement_cache.purge_expired()
+            stats = enhancement_cache.stats()
+            logger.info(
+                f"Enhancement cache: purged {purged} expired rows, "
+                f"{stats['hits']} hits / {stats['misses']} misses ({stats['hit_rate']:.1f}%)"
+            )
+        
+        if Config.SIMILARITY_ENABLED:
+            stats = similarity_index.stats()
+            logger.info(
+                f"Near-duplicate reuse: {stats['reuses']} of {stats['lookups']} lookups "
+                f"({stats['reuse_rate']:.1f}%), {stats['size']} inputs indexed"
+            )
+        
+        if Config.UPDATE_CONCURRENCY > 1:
+            stats = update_processor.stats()
+            busiest = ", ".join(f"{user_id}: {queued}" for user_id, queued in update_processor.busiest_users())
+            logger.info(
+                f"Update processing: {stats['processed']} updates, {stats['contended']} waited on the same user "
+                f"({stats['contention_rate']:.1f}%), longest user queue {stats['max_user_queue']}"
+                + (f", now queued per user: {busiest}" if busiest else "")
+            )
         
         # Ensure database connection is maintained
         try:
@@ -42,6 +76,23 @@ async def periodic_cleanup(context: ContextTypes.DEFAULT_TYPE) -> None:
                 logger.error(f"Failed to reinitialize database: {e2}")
         
         logger.info("Periodic cleanup completed")
-        
+    
+    except Exception as e:
+        logger.error(f"Error in periodic cleanup: {str(e)}")
+
+async def keep_upstream_warm(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Keep a pooled upstream connection open through idle periods."""
+    try:
+        if await keep_connections_warm():
+            logger.debug("Sent upstream keep-alive")
+    except Exception as e:
+        logger.error(f"Error in upstream keep-alive: {str(e)}")
+
+async def flush_enhancement_cache(context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Commit buffered enhancement cache writes to the database."""
+    try:
+        written = enhancement_cache.flush()
+        if written:
+            logger.debug(f"Flushed {written} enhancement cache entries")
     except Exception as e:
-        logger.error(f"Error in periodic cleanup: {str(e)}")
\ No newline at end of file
+        logger.error(f"Error flushing enhancement cache: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,103 @@
+import math
+import re
+from typing import Dict, List, Tuple
+
+from bot.config import Config
+
+# === Token Estimation ===
+# A rough local estimate is enough for budgeting; it deliberately errs on the high side.
+_WORDS = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+# Letters outside the Latin script split into more tokens than English does
+_NON_LATIN = re.compile(r"[^\W\d_\u0000-\u024f\u1e00-\u1eff]")
+# Thai, Lao, Myanmar, Khmer, kana and CJK run words together, and Hangul syllables
+# rarely merge; about a token per character
+_UNSEGMENTED = re.compile(r"[\u0e00-\u0eff\u1000-\u109f\u1780-\u17ff\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]")
+MESSAGE_OVERHEAD_TOKENS = 4  # role / separators per chat message
+TRUNCATION_MARKER = "\n\n[...]\n\n"
+
+class InputTooLongError(Exception):
+    """The request cannot fit the model's context window; raised before any network I/O."""
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of `text` (max of ~4 chars/token and ~0.75 words/token).
+    
+    Non-Latin letters count ~2 chars/token, and unsegmented scripts such as
+    Chinese or Thai ~1 char/token, where a whole sentence reads as one word.
+    """
+    if not text:
+        return 0
+    non_latin = len(_NON_LATIN.findall(text))
+    unsegmented = len(_UNSEGMENTED.findall(text))
+    by_chars = (len(text) - non_latin) / 4 + (non_latin - unsegmented) / 2 + unsegmented
+    by_words = len(_WORDS.findall(text)) * 4 / 3
+    return math.ceil(max(by_chars, by_words))
+
+def estimate_message_tokens(messages: List[Dict]) -> int:
+    return sum(estimate_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+def estimate_input_tokens(messages: List[Dict]) -> int:
+    """Tokens of the last user message, the only part of the prompt that depends on the user."""
+    user_messages = [m for m in messages if m.get("role") == "user"]
+    return estimate_tokens(user_messages[-1].get("content", "")) if user_messages else 0
+
+def context_window(model: str) -> int:
+    return Config.MODEL_CONTEXT_WINDOWS.get(model, Config.DEFAULT_CONTEXT_WINDOW)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep the head and tail of `text` so that it fits roughly `max_tokens`."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # Scale by the observed chars-per-token ratio, then trim until the estimate fits
+    budget_chars = int(len(text) * max_tokens / estimate_tokens(text))
+    while budget_chars > 0:
+        head = text[:budget_chars * 2 // 3]
+        tail = text[len(text) - budget_chars // 3:]
+        truncated = head + TRUNCATION_MARKER + tail
+        if estimate_tokens(truncated) <= max_tokens:
+            return truncated
+        budget_chars = int(budget_chars * 0.9)
+    return ""
+
+def max_output_tokens(input_tokens: int, tier: str, model: str) -> int:
+    """Size the completion budget from the user's input: short inputs get short budgets.
+    
+    The fixed system prompt is left out. Reasoning models get at least
+    Config.REASONING_MIN_OUTPUT_TOKENS because their reasoning counts against it.
+    """
+    cap = Config.MAX_OUTPUT_TOKENS.get(tier, Config.MAX_OUTPUT_TOKENS["free"])
+    wanted = Config.BASE_OUTPUT_TOKENS + int(input_tokens * Config.OUTPUT_TOKENS_PER_INPUT)
+    budget = max(Config.MIN_OUTPUT_TOKENS, min(cap, wanted))
+    if model in Config.REASONING_MODELS:
+        budget = max(budget, Config.REASONING_MIN_OUTPUT_TOKENS)
+    return budget
+
+def budget_request(messages: List[Dict], tier: str, models: List[str]) -> Tuple[List[Dict], int]:
+    """Fit a request to Config.MAX_INPUT_TOKENS and the smallest context window among `models`.
+    
+    The last user message is truncated (or the request rejected when
+    INPUT_OVERFLOW is "reject"). Returns the messages to send and the
+    prompt token estimate; raises InputTooLongError if nothing fits.
+    """
+    user_index = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=None)
+    if user_index is None:
+        return messages, estimate_message_tokens(messages)
+    
+    user_text = messages[user_index]["content"]
+    user_tokens = estimate_tokens(user_text)
+    other_tokens = estimate_message_tokens(messages) - user_tokens
+    
+    # The input must leave room for at least the minimum completion in every candidate model
+    window = min(context_window(model) for model in models)
+    allowed = min(Config.MAX_INPUT_TOKENS, window - other_tokens - Config.MIN_OUTPUT_TOKENS)
+    if allowed <= 0:
+        raise InputTooLongError("The request is too large for the selected model.")
+    
+    if user_tokens > allowed:
+        if Config.INPUT_OVERFLOW == "reject":
+            raise InputTooLongError(
+                f"Your input is too long (~{user_tokens} tokens). Please shorten it to under {allowed} tokens."
+            )
+        messages = list(messages)
+        messages[user_index] = {**messages[user_index], "content": truncate_to_tokens(user_text, allowed)}
+    
+    return messages, estimate_message_tokens(messages)
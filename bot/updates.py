@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Dict, Hashable, List, Optional, Tuple
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from bot.config import Config
+from bot.metrics import stage_metrics
+
+logger = logging.getLogger(__name__)
+
+# === Concurrent Update Processing ===
+class _UserLane:
+    """Updates of one user: a lock that keeps them in order and how many are queued on it."""
+    
+    __slots__ = ("lock", "queued")
+    
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.queued = 0
+
+def _ordering_key(update: object) -> Optional[Hashable]:
+    """Updates with the same key are handled one at a time, in arrival order."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """Handles updates of different users concurrently and each user's updates in order.
+    
+    Messages, button presses and feedback-mode transitions of one user are
+    serialized by a per-user lock (asyncio locks wake waiters first in, first
+    out), so a slow enhancement only holds up that user. At most
+    `max_concurrent_updates` handlers run at once; up to `max_pending_updates`
+    updates are admitted in total, including those waiting for their user's
+    earlier updates, so one busy user can't take every handler slot.
+    """
+    
+    def __init__(self, max_concurrent_updates: int, max_pending_updates: int):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_running = max_concurrent_updates
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self._lanes: Dict[Hashable, _UserLane] = {}
+        self.counters = {"processed": 0, "contended": 0, "max_user_queue": 0}
+        self.running = 0
+    
+    async def initialize(self) -> None:
+        """Nothing to set up; lanes are created on demand."""
+    
+    async def shutdown(self) -> None:
+        self._lanes.clear()
+    
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        key = _ordering_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+        
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _UserLane()
+        lane.queued += 1
+        if lane.queued > 1:
+            self.counters["contended"] += 1
+            self.counters["max_user_queue"] = max(self.counters["max_user_queue"], lane.queued)
+        
+        try:
+            with stage_metrics.timed("user_lock_wait"):
+                await lane.lock.acquire()
+            try:
+                await self._run(coroutine)
+            finally:
+                lane.lock.release()
+        finally:
+            lane.queued -= 1
+            if lane.queued == 0 and self._lanes.get(key) is lane:
+                del self._lanes[key]
+    
+    async def _run(self, coroutine: Awaitable[Any]) -> None:
+        async with self._running:
+            self.running += 1
+            try:
+                await coroutine
+            finally:
+                self.running -= 1
+                self.counters["processed"] += 1
+    
+    def busiest_users(self, limit: int = 5) -> List[Tuple[Hashable, int]]:
+        """Users with the most updates in flight (including the one being handled)."""
+        queued = sorted(((key, lane.queued) for key, lane in self._lanes.items()), key=lambda x: -x[1])
+        return [(key, count) for key, count in queued[:limit] if count > 1]
+    
+    def stats(self) -> Dict[str, Any]:
+        processed = self.counters["processed"]
+        return {
+            **self.counters,
+            "contention_rate": (self.counters["contended"] / processed * 100) if processed else 0.0,
+            "running": self.running,
+            "admitted": self.current_concurrent_updates,
+            "waiting_on_user": sum(lane.queued - 1 for lane in self._lanes.values()),
+            "users": len(self._lanes)
+        }
+
+# Create a singleton instance
+update_processor = PerUserUpdateProcessor(
+    max_concurrent_updates=Config.UPDATE_CONCURRENCY,
+    max_pending_updates=Config.UPDATE_MAX_PENDING
+)
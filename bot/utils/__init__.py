@@ -1,9 +1,11 @@
 """Utility functions for the Prompt-bot application.
 
 This module contains utility functions used throughout the application.
-Currently includes username formatting and sanitization utilities.
+Currently includes username formatting and sanitization utilities and
+boundary-aware splitting of long texts into Telegram messages.
 """
 
 from bot.utils.username import format_username, sanitize_username
+from bot.utils.chunking import MESSAGE_LIMIT, split_text
 
-__all__ = ['format_username', 'sanitize_username']
\ No newline at end of file
+__all__ = ['format_username', 'sanitize_username', 'MESSAGE_LIMIT', 'split_text']
\ No newline at end of file
@@ -0,0 +1,121 @@
+"""Message chunking utilities for the Prompt-bot application.
+
+This module splits long texts into as few Telegram messages as possible,
+breaking at paragraph, line, sentence and word boundaries and keeping
+Markdown code fences valid in every chunk.
+"""
+
+import re
+from typing import List, Optional, Tuple
+
+# Telegram rejects texts over 4096 characters; leave some room for wrapping
+MESSAGE_LIMIT = 4000
+
+# Break points from most to least preferred; each piece keeps its trailing separator
+_SEPARATORS = [re.compile(r"\n"), re.compile(r"(?<=[.!?…])\s+"), re.compile(r"\s+")]
+_FENCE = re.compile(r"^\s*(```|~~~)")
+
+def _split_at(text: str, separator: "re.Pattern") -> List[str]:
+    pieces = []
+    start = 0
+    for match in separator.finditer(text):
+        if match.end() > start:
+            pieces.append(text[start:match.end()])
+            start = match.end()
+    if start < len(text):
+        pieces.append(text[start:])
+    return pieces
+
+def _pieces(text: str, limit: int, level: int = 0) -> List[str]:
+    """Break `text` into pieces of at most `limit` characters at the coarsest boundary that works."""
+    if len(text) <= limit:
+        return [text]
+    if level == len(_SEPARATORS):
+        return [text[i:i + limit] for i in range(0, len(text), limit)]
+    pieces = []
+    for piece in _split_at(text, _SEPARATORS[level]):
+        pieces.extend(_pieces(piece, limit, level + 1))
+    return pieces
+
+def _pack(pieces: List[str], limit: int) -> List[str]:
+    """Concatenate consecutive pieces greedily, which gives the fewest chunks for a fixed order."""
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if current and len(current) + len(piece) > limit:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return [chunk.strip() for chunk in chunks if chunk.strip()]
+
+def _blocks(text: str) -> List[Tuple[str, Optional[str]]]:
+    """Paragraphs and fenced code blocks, each with its trailing blank lines.
+    
+    The second item is the opening fence line for code blocks, None otherwise.
+    """
+    blocks: List[Tuple[str, Optional[str]]] = []
+    current: List[str] = []
+    fence: Optional[str] = None
+    
+    def flush() -> None:
+        nonlocal current
+        if current:
+            blocks.append(("".join(current), fence))
+            current = []
+    
+    for line in text.splitlines(keepends=True):
+        if fence is not None:
+            current.append(line)
+            if _FENCE.match(line) and line.strip() == line.strip()[:3]:
+                flush()
+                fence = None
+        elif _FENCE.match(line):
+            flush()
+            fence = line.rstrip("\n")
+            current.append(line)
+        elif not line.strip():
+            if current:
+                current.append(line)
+                flush()
+            elif blocks:
+                blocks[-1] = (blocks[-1][0] + line, blocks[-1][1])
+        else:
+            current.append(line)
+    flush()
+    return blocks
+
+def _split_code_block(block: str, opener: str, limit: int) -> List[str]:
+    """Split an oversized fenced code block into smaller, separately fenced blocks."""
+    marker = opener.strip()[:3]
+    lines = block.rstrip("\n").split("\n")[1:]
+    if lines and lines[-1].strip() == marker:
+        lines = lines[:-1]
+    budget = limit - len(opener) - len(marker) - 2
+    body_chunks = _pack(_pieces("\n".join(lines) + "\n", budget), budget)
+    return [f"{opener}\n{body}\n{marker}\n\n" for body in body_chunks]
+
+def split_text(text: str, limit: int = MESSAGE_LIMIT) -> List[str]:
+    """Split plain or Markdown text into as few chunks of at most `limit` characters as possible.
+    
+    Breaks at paragraph boundaries where it can, then at lines, sentences and
+    words, and only cuts inside a word when a single word is too long. Fenced
+    code blocks stay whole when they fit; otherwise each part is fenced again.
+    
+    Args:
+        text: The text to split
+        limit: Maximum length of each chunk
+    
+    Returns:
+        List of non-empty chunks
+    """
+    pieces: List[str] = []
+    for block, opener in _blocks(text):
+        if len(block) <= limit:
+            pieces.append(block)
+        elif opener is not None:
+            pieces.extend(_split_code_block(block, opener, limit))
+        else:
+            pieces.extend(_pieces(block, limit))
+    return _pack(pieces, limit)
@@ -1,3 +1,4 @@
+import asyncio
 import logging
 from telegram import Update
 from telegram.ext import (
@@ -5,6 +6,7 @@ from telegram.ext import (
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
+    InlineQueryHandler,
     filters
 )
 
@@ -13,11 +15,40 @@ from bot.config import Config, logger
 from bot.handlers.commands import start, help_command, history_command, model_command, feedback_command, status_command
 from bot.handlers.messages import handle_message
 from bot.handlers.callbacks import button_handler
+from bot.handlers.inline import inline_query_handler
 from bot.handlers.errors import error_handler
 from bot.handlers.admin import export_feedback
-from bot.handlers.stats import feedback_stats
-from bot.tasks import periodic_cleanup
+from bot.handlers.stats import feedback_stats, latency_metrics
+from bot.tasks import periodic_cleanup, keep_upstream_warm, flush_enhancement_cache
 from bot.database import feedback_db
+from bot.cache import enhancement_cache
+from bot.api import init_http_client, close_http_client, warm_up_connections
+from bot.keypool import key_pool
+from bot.metrics import MetricsServer, call_metrics, stage_metrics
+from bot.outbound import outbound_limiter
+from bot.updates import update_processor
+
+# === Application Lifecycle ===
+async def post_init(application: Application) -> None:
+    """Create shared resources once the event loop is running."""
+    init_http_client()
+    if Config.PREWARM_CONNECTIONS > 0:
+        # Pay DNS / TCP / TLS setup now rather than on the first user's request
+        try:
+            await warm_up_connections(Config.PREWARM_CONNECTIONS)
+        except Exception as e:
+            logger.warning(f"Upstream warm-up failed: {str(e)}")
+    if Config.METRICS_PORT:
+        metrics_server = MetricsServer(stage_metrics, Config.METRICS_HOST, Config.METRICS_PORT, call_metrics)
+        await metrics_server.start()
+        application.bot_data["metrics_server"] = metrics_server
+
+async def post_shutdown(application: Application) -> None:
+    """Release shared resources before the event loop closes."""
+    await close_http_client()
+    metrics_server = application.bot_data.pop("metrics_server", None)
+    if metrics_server is not None:
+        await metrics_server.stop()
 
 # === Main Application ===
 def main() -> None:
@@ -31,7 +62,21 @@ def main() -> None:
         # Database is already initialized through import
         
         # Create application
-        application = Application.builder().token(Config.TELEGRAM_BOT_TOKEN).build()
+        builder = (
+            Application.builder()
+            .token(Config.TELEGRAM_BOT_TOKEN)
+            .base_url(Config.TELEGRAM_API_URL)
+            .update_queue(asyncio.Queue(maxsize=Config.UPDATE_QUEUE_SIZE))
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+        )
+        if Config.TELEGRAM_RATE_LIMIT_ENABLED:
+            # Every outgoing Bot API call is paced to stay under Telegram's flood limits
+            builder = builder.rate_limiter(outbound_limiter)
+        if Config.UPDATE_CONCURRENCY > 1:
+            # Different users' updates run concurrently; one user's stay in order
+            builder = builder.concurrent_updates(update_processor)
+        application = builder.build()
         
         # Register handlers
         application.add_handler(CommandHandler("start", start))
@@ -42,8 +87,11 @@ def main() -> None:
         application.add_handler(CommandHandler("status", status_command))
         application.add_handler(CommandHandler("export_feedback", export_feedback))
         application.add_handler(CommandHandler("feedback_stats", feedback_stats))
+        application.add_handler(CommandHandler("metrics", latency_metrics))
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
         application.add_handler(CallbackQueryHandler(button_handler))
+        if Config.INLINE_ENABLED:
+            application.add_handler(InlineQueryHandler(inline_query_handler))
         
         # Error handler
         application.add_error_handler(error_handler)
@@ -52,23 +100,47 @@ def main() -> None:
         job_queue = application.job_queue
         job_queue.run_repeating(periodic_cleanup, interval=3600, first=3600)
         
+        # Keep upstream connections from expiring while the bot is idle
+        if Config.KEEPALIVE_INTERVAL > 0:
+            job_queue.run_repeating(keep_upstream_warm, interval=Config.KEEPALIVE_INTERVAL / 2, first=Config.KEEPALIVE_INTERVAL)
+        
+        # Commit buffered cache writes in batches instead of once per enhancement
+        if Config.CACHE_ENABLED:
+            job_queue.run_repeating(flush_enhancement_cache, interval=Config.CACHE_FLUSH_INTERVAL, first=Config.CACHE_FLUSH_INTERVAL)
+        
         # Start the bot
         logger.info("🚀 Bot is starting...")
-        logger.info(f"Available API keys: {', '.join(['API_KEY_01' if Config.OPENROUTER_API_KEY_01 else '', 'API_KEY_02' if Config.OPENROUTER_API_KEY_02 else '']).strip(', ')}")
+        logger.info(f"API key pool: {', '.join(k.name for k in key_pool.keys)} ({key_pool.strategy})")
         
         # Register shutdown handler to close database connection
         def shutdown():
             logger.info("Shutting down, closing database connection...")
+            enhancement_cache.flush()
             feedback_db.close()
             logger.info("Shutdown complete")
         
         # Start the bot with shutdown handler
-        application.run_polling(allowed_updates=Update.ALL_TYPES, close_loop=False)
+        if Config.UPDATE_MODE == "webhook":
+            logger.info(
+                f"Receiving updates via webhook on {Config.WEBHOOK_LISTEN}:{Config.WEBHOOK_PORT}/{Config.WEBHOOK_PATH}"
+            )
+            application.run_webhook(
+                listen=Config.WEBHOOK_LISTEN,
+                port=Config.WEBHOOK_PORT,
+                url_path=Config.WEBHOOK_PATH,
+                webhook_url=Config.WEBHOOK_URL,
+                secret_token=Config.WEBHOOK_SECRET_TOKEN,
+                max_connections=Config.WEBHOOK_MAX_CONNECTIONS,
+                allowed_updates=Update.ALL_TYPES,
+                close_loop=False
+            )
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES, close_loop=False)
         
         # Close database connection on shutdown
         shutdown()
         logger.info("🛑 Bot has stopped.")
-        
+    
     except Exception as e:
         logger.error(f"Failed to start bot: {str(e)}")
         raise
@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+"""
+Batch Enhancement Script
+
+This script enhances a JSONL file of prompts offline, using the same prompt
+building, key pool, rate limiting and cache as the bot.
+
+Each input line is either a JSON string or an object with an "input" field
+(and optionally an "id"; the line number is used otherwise). Results are
+appended to the output file as they complete, one JSON object per line. The
+output file doubles as the checkpoint: when a run is restarted, items that
+already have a result are skipped, so a crashed run resumes where it stopped,
+and failed items are retried with their old error records removed.
+
+Usage:
+    python batch_enhance.py input.jsonl output.jsonl [--concurrency 5] [--mode free] [--model MODEL]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+# Add parent directory to path so we can import bot modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.api import ask_openrouter, close_http_client, init_http_client
+from bot.cache import enhancement_cache
+from bot.config import Config
+from bot.keypool import key_pool
+from bot.prompts import build_prompt
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+def read_inputs(path: str) -> Iterator[Tuple[str, str]]:
+    """Yield (item_id, text) pairs from a JSONL file without loading it all at once."""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                logger.warning(f"Skipping line {line_no}: invalid JSON ({e})")
+                continue
+            
+            if isinstance(item, str):
+                yield str(line_no), item
+            elif isinstance(item, dict) and isinstance(item.get("input"), str):
+                yield str(item.get("id", line_no)), item["input"]
+            else:
+                logger.warning(f"Skipping line {line_no}: expected a string or an object with an 'input' field")
+
+def load_checkpoint(path: str) -> Set[str]:
+    """Return the ids already enhanced in `path`, leaving one record per id in it.
+    
+    A partially written last line is dropped. Error records (their items are
+    retried) and repeated results are removed, so a retry doesn't duplicate ids.
+    """
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    
+    valid_size = 0
+    stale = 0
+    with open(path, 'rb') as f:
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(raw)
+            except json.JSONDecodeError:
+                break
+            if "enhanced" in result and str(result["id"]) not in done:
+                done.add(str(result["id"]))
+            else:
+                stale += 1
+            valid_size += len(raw)
+    
+    if stale:
+        logger.info(f"Removing {stale} failed or repeated record(s) from {path}")
+        rewrite_checkpoint(path, valid_size)
+    elif valid_size < os.path.getsize(path):
+        logger.warning(f"Truncating incomplete record at the end of {path}")
+        with open(path, 'r+b') as f:
+            f.truncate(valid_size)
+    return done
+
+def rewrite_checkpoint(path: str, valid_size: int) -> None:
+    """Keep the first result of each id within the first `valid_size` bytes, replacing `path` atomically."""
+    kept: Set[str] = set()
+    temp_path = path + ".tmp"
+    with open(path, 'rb') as src, open(temp_path, 'wb') as dst:
+        read = 0
+        for raw in src:
+            read += len(raw)
+            if read > valid_size:
+                break
+            result = json.loads(raw)
+            if "enhanced" in result and str(result["id"]) not in kept:
+                kept.add(str(result["id"]))
+                dst.write(raw)
+        dst.flush()
+        os.fsync(dst.fileno())
+    os.replace(temp_path, path)
+
+class ResultWriter:
+    """Appends one JSON line per result and flushes it, so completed work survives a crash."""
+    
+    def __init__(self, path: str):
+        self._file = open(path, 'a', encoding='utf-8')
+    
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+    
+    def close(self) -> None:
+        self._file.close()
+
+async def enhance_one(item_id: str, text: str, model: str, mode: str) -> Dict[str, Any]:
+    """Enhance a single input; failures are returned as records instead of raised."""
+    started = time.monotonic()
+    try:
+        cached = enhancement_cache.get(text, model) if Config.CACHE_ENABLED else None
+        if cached:
+            enhanced, model_used = cached
+        else:
+            enhanced, model_used = await ask_openrouter(build_prompt(text), model, mode)
+            if Config.CACHE_ENABLED:
+                enhancement_cache.set(text, model, enhanced, model_used)
+    except Exception as e:
+        return {"id": item_id, "input": text, "error": str(e)}
+    
+    return {
+        "id": item_id,
+        "input": text,
+        "enhanced": enhanced,
+        "model_used": model_used,
+        "seconds": round(time.monotonic() - started, 3)
+    }
+
+async def run_batch(
+    input_path: str,
+    output_path: str,
+    concurrency: int,
+    mode: str,
+    model: Optional[str] = None
+) -> Dict[str, int]:
+    """Stream inputs through `concurrency` workers, appending results as they finish.
+    
+    If a result cannot be written (e.g. the disk is full), no new items are
+    started and the write error is raised once the workers have stopped.
+    """
+    model = model or Config.MODELS[mode]
+    done = load_checkpoint(output_path)
+    if done:
+        logger.info(f"Resuming: {len(done)} item(s) already enhanced in {output_path}")
+    
+    counts = {"enhanced": 0, "failed": 0, "skipped": 0}
+    # Bounded so a huge input file is read only as fast as it is processed
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    writer = ResultWriter(output_path)
+    # Set when results can no longer be written; the producer stops and workers drain the queue
+    stop = asyncio.Event()
+    write_errors = []
+    
+    async def worker() -> None:
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                if stop.is_set():
+                    continue
+                record = await enhance_one(item[0], item[1], model, mode)
+                try:
+                    writer.write(record)
+                except OSError as e:
+                    counts["failed"] += 1
+                    write_errors.append(e)
+                    logger.error(f"Could not write the result of item {record['id']}, stopping: {e}")
+                    stop.set()
+                    continue
+                if "error" in record:
+                    counts["failed"] += 1
+                    logger.warning(f"Item {record['id']} failed: {record['error']}")
+                else:
+                    counts["enhanced"] += 1
+                    done.add(record["id"])
+                
+                processed = counts["enhanced"] + counts["failed"]
+                if processed % 50 == 0:
+                    logger.info(f"Progress: {counts['enhanced']} enhanced, {counts['failed']} failed")
+            finally:
+                queue.task_done()
+    
+    init_http_client()
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    try:
+        seen: Set[str] = set()
+        for item_id, text in read_inputs(input_path):
+            if stop.is_set():
+                break
+            if item_id in done or item_id in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(item_id)
+            await queue.put((item_id, text))
+        
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for task in workers:
+            task.cancel()
+        writer.close()
+        await close_http_client()
+    
+    if write_errors:
+        raise write_errors[0]
+    return counts
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Enhance a JSONL file of prompts")
+    parser.add_argument("input", help="JSONL file with one input per line")
+    parser.add_argument("output", help="JSONL file results are appended to (also used to resume)")
+    parser.add_argument("--concurrency", type=int, default=5, help="requests in flight at once (default: 5)")
+    parser.add_argument("--mode", choices=sorted(Config.MODELS), default="free", help="key / model tier (default: free)")
+    parser.add_argument("--model", help="model to use instead of the tier's default")
+    args = parser.parse_args()
+    
+    if not key_pool.keys:
+        print("No OpenRouter API keys configured. Set OPENROUTER_API_KEYS or OPENROUTER_API_KEY_01/02.")
+        sys.exit(1)
+    if not os.path.exists(args.input):
+        print(f"Input file not found: {args.input}")
+        sys.exit(1)
+    
+    print("Batch Enhancement Script")
+    print("========================")
+    print(f"Input: {args.input}")
+    print(f"Output: {args.output}")
+    print(f"Concurrency: {args.concurrency}")
+    
+    started = time.monotonic()
+    try:
+        counts = asyncio.run(run_batch(args.input, args.output, max(1, args.concurrency), args.mode, args.model))
+    except KeyboardInterrupt:
+        print("\nInterrupted. Run the same command again to resume.")
+        sys.exit(130)
+    except OSError as e:
+        print(f"\nStopped: could not write results to {args.output} ({e}). Run the same command again to resume.")
+        sys.exit(1)
+    
+    print(
+        f"\nDone in {time.monotonic() - started:.1f}s: {counts['enhanced']} enhanced, "
+        f"{counts['failed']} failed, {counts['skipped']} skipped"
+    )
+    if counts["failed"]:
+        print("Failed items are recorded with an 'error' field and are retried on the next run.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+"""
+OpenRouter Stub Server
+
+This script runs a local, OpenRouter-compatible chat completions endpoint so
+the bot's API client can be exercised, benchmarked and regression-tested
+without the live service. It supports regular and SSE streaming responses,
+configurable latency distributions and injected failures (401, 429, 5xx,
+malformed bodies and slow-drip responses).
+
+Point the bot at it with:
+    OPENROUTER_URL=http://127.0.0.1:8808/api/v1/chat/completions
+
+Usage:
+    python openrouter_stub.py [--port 8808] [--latency lognormal:0.8,0.5] [--rate-429 0.1] ...
+"""
+
+import argparse
+import json
+import logging
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+FAULTS = ("401", "429", "500", "502", "503", "malformed", "slow")
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Build a sampler (seconds) from `fixed:S`, `uniform:LO,HI`, `exponential:MEAN` or `lognormal:MEDIAN,SIGMA`."""
+    kind, _, raw = spec.partition(":")
+    try:
+        params = [float(p) for p in raw.split(",") if p]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid latency parameters: {spec}")
+    
+    if kind == "fixed" and len(params) == 1:
+        return lambda: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda: random.uniform(params[0], params[1])
+    if kind == "exponential" and len(params) == 1:
+        return lambda: random.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+    if kind == "lognormal" and len(params) == 2:
+        return lambda: random.lognormvariate(math.log(params[0]), params[1]) if params[0] > 0 else 0.0
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution: {spec}")
+
+class StubState:
+    """Settings and counters shared by all request threads."""
+    
+    def __init__(self, args: argparse.Namespace):
+        self.latency = args.latency
+        self.fault_rates = {
+            "401": args.rate_401,
+            "429": args.rate_429,
+            "500": args.rate_5xx,
+            "malformed": args.rate_malformed,
+            "slow": args.rate_slow
+        }
+        self.retry_after = args.retry_after
+        self.drip_interval = args.drip_interval
+        self.words = args.words
+        self.bad_keys = set(args.bad_keys.split(",")) if args.bad_keys else set()
+        self.failing_models = set(args.fail_models.split(",")) if args.fail_models else set()
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"requests": 0, "streamed": 0}
+    
+    def count(self, name: str) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+    
+    def pick_fault(self, api_key: str, model: str, forced: Optional[str]) -> Optional[str]:
+        """Fault for this request: forced by header, by key / model, or drawn at random."""
+        if forced in FAULTS:
+            return forced
+        if api_key in self.bad_keys:
+            return "401"
+        if model in self.failing_models:
+            return "503"
+        roll = random.random()
+        for fault, rate in self.fault_rates.items():
+            if roll < rate:
+                return fault
+            roll -= rate
+        return None
+
+def make_completion(messages: List[Dict[str, Any]], words: int) -> List[str]:
+    """Deterministic fake completion split into word chunks."""
+    user_text = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+    seed = user_text.split()[:8] or ["prompt"]
+    chunks = ["Enhanced", " prompt:"]
+    for i in range(words):
+        chunks.append(" " + seed[i % len(seed)])
+    return chunks
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: StubState = None  # set in main()
+    
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+    
+    def _send_json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(raw)
+    
+    def do_GET(self) -> None:
+        if self.path == "/stats":
+            self._send_json(200, self.state.counts)
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+    
+    def do_POST(self) -> None:
+        state = self.state
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            data = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON body"}})
+            return
+        
+        state.count("requests")
+        model = data.get("model", "stub/model")
+        api_key = self.headers.get("Authorization", "").replace("Bearer ", "", 1)
+        fault = state.pick_fault(api_key, model, self.headers.get("X-Stub-Fault"))
+        if fault:
+            state.count(fault)
+        
+        time.sleep(max(0.0, state.latency()))
+        
+        if fault == "401":
+            self._send_json(401, {"error": {"code": 401, "message": "No auth credentials found"}})
+            return
+        if fault == "429":
+            reset_ms = int((time.time() + state.retry_after) * 1000)
+            self._send_json(
+                429,
+                {"error": {"code": 429, "message": "Rate limit exceeded"}},
+                {
+                    "Retry-After": str(state.retry_after),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": str(reset_ms)
+                }
+            )
+            return
+        if fault in ("500", "502", "503"):
+            self._send_json(int(fault), {"error": {"code": int(fault), "message": "Upstream provider error"}})
+            return
+        
+        chunks = make_completion(data.get("messages", []), state.words)
+        if data.get("stream"):
+            state.count("streamed")
+            self._stream(model, chunks, fault)
+        else:
+            self._complete(model, chunks, fault)
+    
+    def _complete(self, model: str, chunks: List[str], fault: Optional[str]) -> None:
+        if fault == "malformed":
+            raw = b'{"id": "gen-stub", "choices": [{"message": '
+        else:
+            raw = json.dumps({
+                "id": f"gen-{uuid.uuid4().hex[:12]}",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(chunks)}, "finish_reason": "stop"}]
+            }).encode("utf-8")
+        
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        if fault == "slow":
+            # Drip the body out a few bytes at a time
+            for i in range(0, len(raw), 16):
+                self.wfile.write(raw[i:i + 16])
+                self.wfile.flush()
+                time.sleep(self.state.drip_interval)
+        else:
+            self.wfile.write(raw)
+    
+    def _stream(self, model: str, chunks: List[str], fault: Optional[str]) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        
+        def event(payload: str) -> None:
+            self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        
+        gen_id = f"gen-{uuid.uuid4().hex[:12]}"
+        try:
+            self.wfile.write(b": OPENROUTER PROCESSING\n\n")
+            for i, chunk in enumerate(chunks):
+                if fault == "malformed" and i == len(chunks) // 2:
+                    event('{"choices": [{"delta": ')
+                    return
+                event(json.dumps({"id": gen_id, "model": model, "choices": [{"index": 0, "delta": {"content": chunk}}]}))
+                if fault == "slow":
+                    time.sleep(self.state.drip_interval)
+            event(json.dumps({"id": gen_id, "model": model, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+            event("[DONE]")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled (e.g. a hedge lost the race)
+            self.state.count("disconnected")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local OpenRouter-compatible stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument(
+        "--latency", type=parse_latency, default=parse_latency("lognormal:0.5,0.6"),
+        help="time to first byte: fixed:S, uniform:LO,HI, exponential:MEAN or lognormal:MEDIAN,SIGMA"
+    )
+    parser.add_argument("--rate-401", type=float, default=0.0, help="fraction of requests answered with 401")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--rate-malformed", type=float, default=0.0, help="fraction of responses with a broken body")
+    parser.add_argument("--rate-slow", type=float, default=0.0, help="fraction of responses dripped out slowly")
+    parser.add_argument("--retry-after", type=float, default=5.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--drip-interval", type=float, default=0.5, help="seconds between slow-drip chunks")
+    parser.add_argument("--words", type=int, default=60, help="words per completion")
+    parser.add_argument("--bad-keys", default="", help="comma-separated API keys that always get 401")
+    parser.add_argument("--fail-models", default="", help="comma-separated models that always get 503")
+    args = parser.parse_args()
+    
+    if args.rate_401 + args.rate_429 + args.rate_5xx + args.rate_malformed + args.rate_slow > 1:
+        print("Fault rates must add up to at most 1.")
+        sys.exit(1)
+    
+    StubHandler.state = StubState(args)
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    server.daemon_threads = True
+    
+    print("OpenRouter Stub Server")
+    print("======================")
+    print(f"Endpoint: http://{args.host}:{args.port}/api/v1/chat/completions")
+    print(f"Stats:    http://{args.host}:{args.port}/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\nServed: {json.dumps(StubHandler.state.counts)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Test script for the API key circuit breaker
+
+This script tests that a breaker opens on failures, turns half-open after its
+cool-down, lets a limited number of trial requests through, and closes again
+after a successful trial (or re-opens after a failed one).
+
+Usage:
+    python test_breaker.py
+"""
+
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Add parent directory to path so we can import bot modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.breaker import CircuitBreaker
+
+class FakeClock:
+    """Stands in for time.monotonic so cool-downs pass instantly"""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self) -> float:
+        return self.now
+    
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+class CircuitBreakerTest(unittest.TestCase):
+    """Test cases for CircuitBreaker state transitions"""
+    
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = patch("bot.breaker.time.monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.breaker = CircuitBreaker("key1", failure_threshold=3, open_seconds=10, half_open_max_calls=1)
+    
+    def open_breaker(self) -> None:
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow_request())
+            self.breaker.record_failure()
+    
+    def test_opens_after_consecutive_failures(self):
+        """Test that the breaker opens after failure_threshold failures in a row"""
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.assertEqual(self.breaker.retry_in(), 10)
+    
+    def test_success_resets_consecutive_failures(self):
+        """Test that a success in between keeps the breaker closed"""
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_opens_on_error_rate(self):
+        """Test that a high error rate opens the breaker without consecutive failures"""
+        breaker = CircuitBreaker("key2", failure_threshold=10, error_rate_threshold=0.5, min_requests=4)
+        for succeeded in (True, False, True, False):
+            if succeeded:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+    
+    def test_open_half_open_closed(self):
+        """Test the full recovery path: open, half-open after the cool-down, closed after a good trial"""
+        self.open_breaker()
+        self.clock.advance(9.9)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        
+        self.clock.advance(0.1)
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        # Only one trial at a time
+        self.assertFalse(self.breaker.allow_request())
+        self.assertFalse(self.breaker.is_available())
+        
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.error_rate, 0.0)
+        self.assertTrue(self.breaker.allow_request())
+    
+    def test_failed_trial_reopens(self):
+        """Test that a failed trial request opens the breaker for another cool-down"""
+        self.open_breaker()
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow_request())
+        
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.retry_in(), 10)
+    
+    def test_abandoned_trial_does_not_block_recovery(self):
+        """Test that a trial whose outcome is never recorded frees its slot after a cool-down"""
+        self.open_breaker()
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow_request())
+        
+        self.clock.advance(10)
+        self.assertTrue(self.breaker.allow_request())
+    
+    def test_trip_and_reset(self):
+        """Test forcing the breaker open and resetting it by hand"""
+        self.breaker.trip("authentication failed")
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        
+        self.breaker.reset()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow_request())
+
+if __name__ == "__main__":
+    unittest.main()
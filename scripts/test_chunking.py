@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""
+Test script for message chunking
+
+This script tests that long texts are split into chunks Telegram accepts:
+no chunk exceeds the message limit, code fences stay balanced in every chunk,
+and replies wrap each chunk in a complete <pre> block.
+
+Usage:
+    python test_chunking.py
+"""
+
+import html
+import os
+import re
+import sys
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add parent directory to path so we can import bot modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the feedback database the handlers open on import out of the working directory
+os.environ.setdefault("FEEDBACK_DB_PATH", os.path.join(tempfile.mkdtemp(), "test_feedback.db"))
+
+from bot.config import Config
+from bot.handlers import messages
+from bot.utils.chunking import MESSAGE_LIMIT, split_text
+
+# Telegram's limit on the text of one message, counted after entity parsing
+TELEGRAM_LIMIT = 4096
+
+def sample_texts() -> dict:
+    """Long texts that stress each kind of break point"""
+    paragraph = "This sentence explains one more requirement of the prompt. " * 12
+    code = "\n".join(f"    result_{i} = compute(value_{i}) + offset  # step {i}" for i in range(400))
+    return {
+        "paragraphs": "\n\n".join(paragraph.strip() for _ in range(40)),
+        "single line": "word " * 3000,
+        "no spaces": "x" * 10000,
+        "long code block": f"Intro paragraph.\n\n```python\n{code}\n```\n\nClosing paragraph.",
+        "mixed": "\n\n".join(
+            f"## Section {i}\n\n{paragraph}\n\n```\n{code[:1500]}\n```" for i in range(6)
+        ),
+        "html characters": "<b>&amp;</b> <i>tags</i> & entities " * 400
+    }
+
+class SplitTextTest(unittest.TestCase):
+    """Test cases for split_text"""
+    
+    def test_chunks_never_exceed_the_limit(self):
+        """Test that every chunk fits the message limit"""
+        for name, text in sample_texts().items():
+            with self.subTest(text=name):
+                chunks = split_text(text)
+                self.assertGreater(len(chunks), 1)
+                for chunk in chunks:
+                    self.assertLessEqual(len(chunk), MESSAGE_LIMIT)
+                    self.assertTrue(chunk.strip())
+    
+    def test_custom_limit(self):
+        """Test that a smaller limit is honoured too"""
+        for name, text in sample_texts().items():
+            with self.subTest(text=name):
+                self.assertTrue(all(len(chunk) <= 500 for chunk in split_text(text, 500)))
+    
+    def test_no_text_is_lost(self):
+        """Test that chunks contain all the words of the original text, in order"""
+        text = sample_texts()["paragraphs"]
+        self.assertEqual(" ".join(split_text(text)).split(), text.split())
+    
+    def test_short_text_is_one_chunk(self):
+        """Test that a text under the limit is returned unchanged"""
+        self.assertEqual(split_text("A short prompt."), ["A short prompt."])
+        self.assertEqual(split_text(""), [])
+    
+    def test_code_fences_stay_balanced(self):
+        """Test that a split code block is closed and reopened in every chunk"""
+        for name in ("long code block", "mixed"):
+            with self.subTest(text=name):
+                for chunk in split_text(sample_texts()[name]):
+                    fences = re.findall(r"^\s*```", chunk, re.MULTILINE)
+                    self.assertEqual(len(fences) % 2, 0, chunk[:80])
+    
+    def test_code_block_reopened_with_its_language(self):
+        """Test that continuation chunks of a code block keep the opening fence's language"""
+        chunks = split_text(sample_texts()["long code block"])
+        code_chunks = [chunk for chunk in chunks if "compute(" in chunk]
+        self.assertGreater(len(code_chunks), 1)
+        for chunk in code_chunks:
+            self.assertIn("```python", chunk)
+
+class ReplyLongTextTest(unittest.IsolatedAsyncioTestCase):
+    """Test cases for reply_long_text"""
+    
+    async def replies(self, text: str) -> list:
+        message = MagicMock()
+        message.reply_text = AsyncMock()
+        message.reply_document = AsyncMock()
+        with patch.object(Config, "DOCUMENT_THRESHOLD", 10 ** 6):
+            await messages.reply_long_text(message, text, "result.txt")
+        message.reply_document.assert_not_called()
+        return [call.args[0] for call in message.reply_text.call_args_list]
+    
+    async def test_every_reply_is_one_balanced_pre_block(self):
+        """Test that each reply is a single <pre> block whose visible text fits Telegram's limit"""
+        for name, text in sample_texts().items():
+            with self.subTest(text=name):
+                for reply in await self.replies(text):
+                    self.assertTrue(reply.startswith("<pre>"))
+                    self.assertTrue(reply.endswith("</pre>"))
+                    inner = reply[len("<pre>"):-len("</pre>")]
+                    self.assertNotIn("<pre>", inner)
+                    self.assertNotIn("</pre>", inner)
+                    self.assertNotIn("<", inner)
+                    self.assertLessEqual(len(html.unescape(inner)), TELEGRAM_LIMIT)
+    
+    async def test_replies_reproduce_the_text(self):
+        """Test that unescaping the replies gives back the original words"""
+        text = sample_texts()["html characters"]
+        replies = await self.replies(text)
+        visible = " ".join(html.unescape(reply[len("<pre>"):-len("</pre>")]) for reply in replies)
+        self.assertEqual(visible.split(), text.split())
+    
+    async def test_long_text_becomes_a_document(self):
+        """Test that texts over the document threshold are sent as one file"""
+        message = MagicMock()
+        message.reply_text = AsyncMock()
+        message.reply_document = AsyncMock()
+        with patch.object(Config, "DOCUMENT_THRESHOLD", 100):
+            await messages.reply_long_text(message, "x" * 101, "result.txt")
+        message.reply_text.assert_not_called()
+        message.reply_document.assert_awaited_once()
+        self.assertEqual(message.reply_document.call_args.kwargs["document"], b"x" * 101)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+"""
+Test script for compact replies
+
+This script tests that a result delivered in compact mode (result and action
+buttons in one message) is not overwritten when one of its buttons is pressed.
+
+Usage:
+    python test_compact_replies.py
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Add parent directory to path so we can import bot modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the feedback database the handlers open on import out of the working directory
+os.environ.setdefault("FEEDBACK_DB_PATH", os.path.join(tempfile.mkdtemp(), "test_feedback.db"))
+
+from bot.config import Config
+from bot.handlers import callbacks, messages
+
+ENHANCED = "Act as a travel writer. Describe Lisbon in 200 words."
+
+def result_message_text() -> str:
+    """What Telegram reports as the text of a compact result (HTML entities stripped)."""
+    return f"✅ {messages.RESULT_TITLE}\n\n{ENHANCED}\n\n🎯 Put it this prompt in latest AI model..."
+
+def button_update(data: str, user_id: int, message_text: str) -> MagicMock:
+    update = MagicMock()
+    update.message = None
+    update.effective_user.id = user_id
+    update.effective_user.first_name = "Tester"
+    query = update.callback_query
+    query.data = data
+    query.from_user.id = user_id
+    query.answer = AsyncMock()
+    query.edit_message_text = AsyncMock()
+    query.message.text = message_text
+    query.message.reply_text = AsyncMock()
+    return update
+
+class CompactReplyTest(unittest.IsolatedAsyncioTestCase):
+    """Test cases for the buttons of compact results"""
+    
+    async def test_result_and_buttons_share_the_progress_message(self):
+        """Test that the result and its buttons replace the progress message in one edit"""
+        update = MagicMock()
+        update.effective_user.id = 4201
+        update.message.text = "describe lisbon"
+        progress_msg = MagicMock()
+        progress_msg.edit_text = AsyncMock()
+        update.message.reply_text = AsyncMock(return_value=progress_msg)
+        context = MagicMock()
+        context.user_data = {}
+        context.bot.send_chat_action = AsyncMock()
+        
+        with patch.object(Config, "COMPACT_REPLIES", True), \
+                patch.object(Config, "CACHE_ENABLED", False), \
+                patch.object(Config, "SIMILARITY_ENABLED", False), \
+                patch.object(Config, "STREAM_RESPONSES", False), \
+                patch.object(messages, "ask_openrouter", AsyncMock(return_value=(ENHANCED, "model"))):
+            await messages.handle_message(update, context)
+        
+        progress_msg.edit_text.assert_awaited_once()
+        args, kwargs = progress_msg.edit_text.call_args
+        self.assertTrue(args[0].startswith(messages.RESULT_HEADER))
+        callback_data = [button.callback_data for row in kwargs["reply_markup"].inline_keyboard for button in row]
+        self.assertEqual(callback_data, ["improve:4201", "view_history", "back_to_main"])
+        # Only the "Analyzing" reply went out as a new message
+        update.message.reply_text.assert_awaited_once()
+    
+    async def test_result_buttons_keep_the_result(self):
+        """Test that the result's buttons answer with a new message"""
+        for data in ("improve:4202", "view_history", "back_to_main"):
+            with self.subTest(data=data):
+                update = button_update(data, 4202, result_message_text())
+                await callbacks.button_handler(update, MagicMock())
+                update.callback_query.edit_message_text.assert_not_awaited()
+                update.callback_query.message.reply_text.assert_awaited_once()
+    
+    async def test_menu_buttons_still_edit_in_place(self):
+        """Test that the same buttons on other messages still edit them"""
+        for data in ("improve:4203", "view_history", "back_to_main"):
+            with self.subTest(data=data):
+                update = button_update(data, 4203, "👋 Hey Tester!")
+                await callbacks.button_handler(update, MagicMock())
+                update.callback_query.edit_message_text.assert_awaited_once()
+                update.callback_query.message.reply_text.assert_not_awaited()
+
+if __name__ == "__main__":
+    unittest.main()
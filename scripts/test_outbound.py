@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+"""
+Test script for outbound Telegram rate limiting
+
+This script tests that edits of one message that are still waiting for their
+turn collapse into a single request carrying the newest text, and that every
+caller gets that request's result.
+
+Usage:
+    python test_outbound.py
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+from telegram.error import BadRequest
+
+# Add parent directory to path so we can import bot modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.outbound import OutboundRateLimiter
+
+class FakeBotApi:
+    """Records the texts that would have been sent to Telegram"""
+    
+    def __init__(self):
+        self.sent = []
+        self.fail_with = None
+    
+    async def call(self, text: str) -> dict:
+        if self.fail_with is not None:
+            raise self.fail_with
+        self.sent.append(text)
+        return {"text": text, "request": len(self.sent)}
+
+class OutboundCoalescingTest(unittest.IsolatedAsyncioTestCase):
+    """Test cases for coalescing message edits in OutboundRateLimiter"""
+    
+    def setUp(self):
+        # One message per chat every 0.1s, so later edits have to queue
+        self.limiter = OutboundRateLimiter(global_rate=1000, chat_rate=10, chat_burst=1)
+        self.api = FakeBotApi()
+    
+    def edit(self, text: str, chat_id: int = 42, message_id: int = 7):
+        return self.limiter.process_request(
+            self.api.call, (text,), {}, "editMessageText",
+            {"chat_id": chat_id, "message_id": message_id, "text": text}, None
+        )
+    
+    async def start_edits(self, texts, **ids) -> list:
+        tasks = []
+        for text in texts:
+            tasks.append(asyncio.create_task(self.edit(text, **ids)))
+            await asyncio.sleep(0)
+        return tasks
+    
+    async def test_queued_edits_collapse_into_the_final_one(self):
+        """Test that only the first and the newest of a burst of edits are sent"""
+        tasks = await self.start_edits(["draft 1", "draft 2", "draft 3", "final"])
+        results = await asyncio.gather(*tasks)
+        
+        self.assertEqual(self.api.sent, ["draft 1", "final"])
+        self.assertEqual(self.limiter.counters["coalesced_edits"], 2)
+        self.assertEqual(self.limiter.counters["sent"], 2)
+        # Callers whose edit was replaced get the result of the edit that went out
+        self.assertEqual([r["text"] for r in results], ["draft 1", "final", "final", "final"])
+    
+    async def test_edits_of_other_messages_are_not_merged(self):
+        """Test that queued edits of different messages in one chat are all sent"""
+        tasks = await self.start_edits(["a1", "a2"], message_id=1)
+        tasks += await self.start_edits(["b1"], message_id=2)
+        tasks += await self.start_edits(["c1"], chat_id=43, message_id=1)
+        await asyncio.gather(*tasks)
+        
+        self.assertCountEqual(self.api.sent, ["a1", "a2", "b1", "c1"])
+        self.assertEqual(self.limiter.counters["coalesced_edits"], 0)
+    
+    async def test_edit_after_send_is_not_merged(self):
+        """Test that an edit arriving after the previous one went out is sent on its own"""
+        await self.edit("first")
+        await self.edit("second")
+        self.assertEqual(self.api.sent, ["first", "second"])
+        self.assertEqual(self.limiter.counters["coalesced_edits"], 0)
+    
+    async def test_coalesced_callers_share_the_error(self):
+        """Test that a failed edit fails every caller it stood in for"""
+        await self.edit("first")
+        self.api.fail_with = BadRequest("Message to edit not found")
+        tasks = await self.start_edits(["second", "third"])
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        self.assertTrue(all(isinstance(r, BadRequest) for r in results))
+        self.assertEqual(self.limiter._pending_edits, {})
+    
+    async def test_cancelled_edit_releases_coalesced_callers(self):
+        """Test that cancelling the queued edit doesn't leave merged callers waiting forever"""
+        await self.edit("first")
+        tasks = await self.start_edits(["second", "third"])
+        tasks[0].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        
+        self.assertTrue(all(isinstance(r, asyncio.CancelledError) for r in results))
+        self.assertEqual(self.limiter._pending_edits, {})
+        self.assertEqual(self.api.sent, ["first"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+"""
+Test script for upstream rate limiting
+
+This script tests the token buckets in front of upstream calls: waiting for a
+token, refunding tokens of requests that were never sent, and backing off
+after a 429 according to Retry-After and X-RateLimit-* headers.
+
+Usage:
+    python test_ratelimit.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+from email.utils import formatdate
+
+# Add parent directory to path so we can import bot modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.ratelimit import RateLimiter, TokenBucket, parse_retry_after
+
+class TokenBucketTest(unittest.IsolatedAsyncioTestCase):
+    """Test cases for TokenBucket"""
+    
+    async def test_burst_is_free_then_callers_wait(self):
+        """Test that requests beyond the burst wait for the refill rate"""
+        bucket = TokenBucket(rate=20, capacity=2)
+        started = time.monotonic()
+        await bucket.acquire()
+        await bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.02)
+        
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.04)
+        self.assertEqual(bucket.throttled, 1)
+    
+    async def test_wait_beyond_timeout_raises(self):
+        """Test that a wait longer than the timeout fails fast instead of sleeping"""
+        bucket = TokenBucket(rate=1, capacity=1)
+        await bucket.acquire()
+        
+        started = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            await bucket.acquire(timeout=0.1)
+        self.assertLess(time.monotonic() - started, 0.05)
+        self.assertEqual(bucket.waiting, 0)
+    
+    async def test_refund_returns_the_token(self):
+        """Test that a refunded token can be used right away"""
+        bucket = TokenBucket(rate=0.1, capacity=1)
+        await bucket.acquire()
+        bucket.refund()
+        await bucket.acquire(timeout=0.01)
+    
+    async def test_refund_never_exceeds_capacity(self):
+        """Test that refunds don't let a full bucket burst past its capacity"""
+        bucket = TokenBucket(rate=0.1, capacity=2)
+        bucket.refund(5)
+        await bucket.acquire(2, timeout=0.01)
+        with self.assertRaises(asyncio.TimeoutError):
+            await bucket.acquire(timeout=0.01)
+    
+    async def test_block_for_pauses_a_full_bucket(self):
+        """Test that block_for holds back requests even when tokens are available"""
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.block_for(0.1)
+        self.assertFalse(bucket.is_idle())
+        
+        started = time.monotonic()
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+class RetryAfterTest(unittest.TestCase):
+    """Test cases for parse_retry_after"""
+    
+    def test_delta_seconds(self):
+        """Test Retry-After given in seconds"""
+        self.assertEqual(parse_retry_after({"retry-after": "7"}), 7.0)
+    
+    def test_http_date(self):
+        """Test Retry-After given as an HTTP date"""
+        wait = parse_retry_after({"retry-after": formatdate(time.time() + 30, usegmt=True)})
+        self.assertAlmostEqual(wait, 30, delta=2)
+    
+    def test_date_in_the_past_is_zero(self):
+        """Test that a Retry-After date in the past never gives a negative wait"""
+        self.assertEqual(parse_retry_after({"retry-after": formatdate(time.time() - 60, usegmt=True)}), 0.0)
+    
+    def test_reset_in_epoch_milliseconds(self):
+        """Test X-RateLimit-Reset in epoch milliseconds, as OpenRouter sends it"""
+        reset = str(int((time.time() + 12) * 1000))
+        self.assertAlmostEqual(parse_retry_after({"x-ratelimit-reset": reset}), 12, delta=1)
+    
+    def test_retry_after_wins_over_reset(self):
+        """Test that Retry-After takes precedence over X-RateLimit-Reset"""
+        self.assertEqual(parse_retry_after({"retry-after": "3", "x-ratelimit-reset": "60"}), 3.0)
+    
+    def test_no_headers(self):
+        """Test that missing or unparseable headers give None"""
+        self.assertIsNone(parse_retry_after({}))
+        self.assertIsNone(parse_retry_after({"retry-after": "soon"}))
+
+class RateLimiterTest(unittest.IsolatedAsyncioTestCase):
+    """Test cases for RateLimiter"""
+    
+    async def test_key_token_refunded_when_model_wait_times_out(self):
+        """Test that the key's token is handed back if the model bucket never lets the request go"""
+        limiter = RateLimiter(key_rate=0.1, key_burst=1, model_rate=0.1, model_burst=1)
+        await limiter.bucket_for_model("m1").acquire()
+        
+        with self.assertRaises(asyncio.TimeoutError):
+            await limiter.acquire("key1", "m1", timeout=0.05)
+        
+        # The key still has its token for a request to another model
+        await limiter.acquire("key1", "m2", timeout=0.01)
+    
+    async def test_rate_limited_blocks_key_and_model(self):
+        """Test that a 429 pauses both buckets for the Retry-After time"""
+        limiter = RateLimiter(key_rate=100, key_burst=10, model_rate=100, model_burst=10)
+        wait = limiter.on_rate_limited("key1", "m1", {"retry-after": "0.1"})
+        self.assertEqual(wait, 0.1)
+        self.assertEqual(limiter.rate_limited, 1)
+        
+        with self.assertRaises(asyncio.TimeoutError):
+            await limiter.bucket_for_key("key1").acquire(timeout=0.05)
+        with self.assertRaises(asyncio.TimeoutError):
+            await limiter.bucket_for_model("m1").acquire(timeout=0.05)
+        await limiter.acquire("key1", "m1", timeout=0.2)
+    
+    async def test_rate_limited_without_headers_uses_default(self):
+        """Test the default back-off when a 429 carries no timing headers"""
+        limiter = RateLimiter(key_rate=1, key_burst=1, model_rate=1, model_burst=1, default_retry_after=4.0)
+        self.assertEqual(limiter.on_rate_limited("key1", "m1", {}), 4.0)
+    
+    async def test_remaining_header_drains_key_bucket(self):
+        """Test that X-RateLimit-Remaining: 0 blocks the key until the reset"""
+        limiter = RateLimiter(key_rate=100, key_burst=10, model_rate=0, model_burst=0)
+        limiter.observe("key1", {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "0.1"})
+        
+        with self.assertRaises(asyncio.TimeoutError):
+            await limiter.acquire("key1", "m1", timeout=0.05)
+        await limiter.acquire("key1", "m1", timeout=0.2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Test script for the upstream scheduler
+
+This script tests that queued upstream calls are released lane by lane
+(admin, then advanced, then free), that waiting calls age into higher lanes,
+and that per-model caps and timeouts are respected.
+
+Usage:
+    python test_scheduler.py
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+
+# Add parent directory to path so we can import bot modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.scheduler import UpstreamScheduler
+
+class UpstreamSchedulerTest(unittest.IsolatedAsyncioTestCase):
+    """Test cases for UpstreamScheduler"""
+    
+    async def queue_calls(self, scheduler: UpstreamScheduler, calls, order: list) -> list:
+        """Start one waiting acquire per (lane, model) pair, recording the order slots are granted"""
+        async def call(lane: str, model: str) -> None:
+            await scheduler.acquire(lane, model)
+            order.append(lane)
+        
+        tasks = []
+        for lane, model in calls:
+            tasks.append(asyncio.create_task(call(lane, model)))
+            await asyncio.sleep(0)
+        return tasks
+    
+    async def test_lanes_released_by_priority(self):
+        """Test that admin calls go before advanced, and advanced before free, regardless of arrival"""
+        scheduler = UpstreamScheduler(max_concurrency=1, default_model_limit=5, aging_seconds=60)
+        await scheduler.acquire("free", "m1")
+        
+        order = []
+        tasks = await self.queue_calls(scheduler, [("free", "m1"), ("advanced", "m1"), ("admin", "m1")], order)
+        self.assertEqual(scheduler.stats()["queued"], 3)
+        
+        for _ in range(3):
+            scheduler.release("m1")
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["admin", "advanced", "free"])
+    
+    async def test_same_lane_is_first_in_first_out(self):
+        """Test that calls in one lane keep their arrival order"""
+        scheduler = UpstreamScheduler(max_concurrency=1, default_model_limit=5, aging_seconds=60)
+        await scheduler.acquire("free", "m1")
+        
+        order = []
+        async def call(name: str) -> None:
+            await scheduler.acquire("free", "m1")
+            order.append(name)
+        
+        tasks = []
+        for name in ("first", "second", "third"):
+            tasks.append(asyncio.create_task(call(name)))
+            await asyncio.sleep(0)
+        for _ in range(3):
+            scheduler.release("m1")
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["first", "second", "third"])
+    
+    async def test_aging_promotes_waiting_calls(self):
+        """Test that a free call that waited long enough goes before a fresh advanced call"""
+        scheduler = UpstreamScheduler(max_concurrency=1, default_model_limit=5, aging_seconds=0.05)
+        await scheduler.acquire("free", "m1")
+        
+        order = []
+        tasks = await self.queue_calls(scheduler, [("free", "m1")], order)
+        # Two aging periods: the free call now ranks above the advanced lane
+        await asyncio.sleep(0.12)
+        tasks += await self.queue_calls(scheduler, [("advanced", "m1")], order)
+        
+        for _ in range(2):
+            scheduler.release("m1")
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["free", "advanced"])
+    
+    async def test_model_cap_lets_other_models_through(self):
+        """Test that a call for a saturated model doesn't hold up calls for other models"""
+        scheduler = UpstreamScheduler(max_concurrency=3, default_model_limit=1)
+        await scheduler.acquire("admin", "m1")
+        
+        order = []
+        tasks = await self.queue_calls(scheduler, [("admin", "m1"), ("free", "m2")], order)
+        await asyncio.sleep(0)
+        self.assertEqual(order, ["free"])
+        self.assertEqual(scheduler.active_by_model, {"m1": 1, "m2": 1})
+        
+        scheduler.release("m1")
+        await asyncio.gather(*tasks)
+        self.assertEqual(order, ["free", "admin"])
+    
+    async def test_timeout_leaves_the_queue(self):
+        """Test that a call that gives up waiting is removed and takes no slot"""
+        scheduler = UpstreamScheduler(max_concurrency=1, default_model_limit=1)
+        await scheduler.acquire("free", "m1")
+        
+        with self.assertRaises(asyncio.TimeoutError):
+            await scheduler.acquire("admin", "m1", timeout=0.02)
+        self.assertEqual(scheduler.stats()["queued"], 0)
+        
+        scheduler.release("m1")
+        self.assertEqual(scheduler.active, 0)
+    
+    async def test_try_acquire_never_jumps_the_queue(self):
+        """Test that try_acquire only succeeds when a slot is free and nobody is waiting"""
+        scheduler = UpstreamScheduler(max_concurrency=2, default_model_limit=1)
+        self.assertTrue(scheduler.try_acquire("m1"))
+        self.assertFalse(scheduler.try_acquire("m1"))
+        
+        order = []
+        tasks = await self.queue_calls(scheduler, [("free", "m1")], order)
+        self.assertFalse(scheduler.try_acquire("m2"))
+        
+        scheduler.release("m1")
+        await asyncio.gather(*tasks)
+        self.assertTrue(scheduler.try_acquire("m2"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+"""
+Update Delivery Harness
+
+This script stands in for the Telegram Bot API so update-to-handler latency
+can be measured locally, in webhook mode and in polling mode alike. It serves
+the Bot API methods the bot calls, feeds it synthetic text messages (POSTed to
+the bot's webhook, or handed out through getUpdates) and records when the bot
+makes its first call back for each chat, which is the handler's sendChatAction.
+
+Start the harness first, then the bot with:
+    TELEGRAM_API_URL=http://127.0.0.1:8809/bot
+    OPENROUTER_URL=http://127.0.0.1:8808/api/v1/chat/completions   (scripts/openrouter_stub.py)
+and either the default polling mode or UPDATE_MODE=webhook with
+WEBHOOK_URL=http://127.0.0.1:8443/telegram. The harness detects the mode from
+the bot's setWebhook / getUpdates calls.
+
+Usage:
+    python webhook_harness.py [--updates 200] [--rate 20] [--port 8809] [--webhook-target URL]
+"""
+
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Synthetic chats start here so they can't collide with real users
+FIRST_CHAT_ID = 900_000_000
+
+class HarnessState:
+    """Fake Bot API state shared by the request threads and the driver."""
+    
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending: List[Dict[str, Any]] = []  # updates for getUpdates
+        self.webhook_url: Optional[str] = None
+        self.secret_token: Optional[str] = None
+        self.polling = False
+        self.delivered_at: Dict[int, float] = {}  # chat_id -> update handed to the bot
+        self.handled_at: Dict[int, float] = {}  # chat_id -> first call back from the bot
+        self.calls: Dict[str, int] = {}
+    
+    def record_call(self, method: str, chat_id: Optional[int]) -> None:
+        now = time.perf_counter()
+        with self.cond:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            if chat_id in self.delivered_at and chat_id not in self.handled_at:
+                self.handled_at[chat_id] = now
+                self.cond.notify_all()
+
+def make_update(update_id: int, chat_id: int) -> Dict[str, Any]:
+    user = {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"load{update_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": "Load"},
+            "from": user,
+            "text": f"Write a short story about a lighthouse keeper, variant {update_id}"
+        }
+    }
+
+def make_message(chat_id: int, text: str) -> Dict[str, Any]:
+    return {
+        "message_id": int(time.time() * 1000) % 1_000_000_000,
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "text": text
+    }
+
+class BotAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: HarnessState = None  # set in main()
+    
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+    
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+    
+    def _read_params(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length) if length else b""
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.startswith("application/json"):
+            return json.loads(raw or b"{}")
+        if content_type.startswith("application/x-www-form-urlencoded"):
+            return {k: v[0] for k, v in parse_qs(raw.decode("utf-8")).items()}
+        return {}  # multipart uploads (documents) carry nothing we need
+    
+    def do_POST(self) -> None:
+        state = self.state
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        params = self._read_params()
+        try:
+            chat_id = int(params["chat_id"]) if "chat_id" in params else None
+        except ValueError:
+            chat_id = None
+        state.record_call(method, chat_id)
+        
+        if method == "getMe":
+            result: Any = {
+                "id": 1, "is_bot": True, "first_name": "Harness", "username": "harness_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": True
+            }
+        elif method == "setWebhook":
+            with state.cond:
+                state.webhook_url = params.get("url")
+                state.secret_token = params.get("secret_token")
+                state.cond.notify_all()
+            result = True
+        elif method == "deleteWebhook":
+            with state.cond:
+                state.webhook_url = None
+            result = True
+        elif method == "getWebhookInfo":
+            result = {"url": state.webhook_url or "", "has_custom_certificate": False, "pending_update_count": 0}
+        elif method == "getUpdates":
+            result = self._get_updates(params)
+        elif method in ("sendMessage", "editMessageText", "sendDocument"):
+            result = make_message(chat_id or 0, params.get("text", ""))
+        else:
+            result = True
+        self._send_json(200, {"ok": True, "result": result})
+    
+    def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        state = self.state
+        offset = int(params.get("offset") or 0)
+        deadline = time.monotonic() + min(float(params.get("timeout") or 0), 10.0)
+        with state.cond:
+            if not state.polling:
+                state.polling = True
+                state.cond.notify_all()
+            state.pending = [u for u in state.pending if u["update_id"] >= offset]
+            while not state.pending and time.monotonic() < deadline:
+                state.cond.wait(deadline - time.monotonic())
+            return list(state.pending)
+
+def post_update(target: str, secret: Optional[str], update: Dict[str, Any]) -> int:
+    request = urllib.request.Request(
+        target,
+        data=json.dumps(update).encode("utf-8"),
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret or ""},
+        method="POST"
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake Bot API for measuring update-to-handler latency")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8809)
+    parser.add_argument("--updates", type=int, default=200, help="synthetic updates to deliver")
+    parser.add_argument("--rate", type=float, default=20.0, help="updates per second")
+    parser.add_argument("--wait", type=float, default=60.0, help="seconds to wait for the bot to connect")
+    parser.add_argument("--timeout", type=float, default=30.0, help="seconds to wait for handlers after the last update")
+    parser.add_argument(
+        "--webhook-target", default=None,
+        help="where to POST updates (default: http://127.0.0.1:8443 plus the registered webhook path)"
+    )
+    args = parser.parse_args()
+    
+    state = HarnessState()
+    BotAPIHandler.state = state
+    server = ThreadingHTTPServer((args.host, args.port), BotAPIHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    
+    print("Update Delivery Harness")
+    print("=======================")
+    print(f"Bot API: http://{args.host}:{args.port}/bot")
+    print("Waiting for the bot to connect...")
+    
+    with state.cond:
+        state.cond.wait_for(lambda: state.webhook_url or state.polling, timeout=args.wait)
+        mode = "webhook" if state.webhook_url else "polling" if state.polling else None
+    if mode is None:
+        print("The bot never called setWebhook or getUpdates.")
+        sys.exit(1)
+    print(f"Mode: {mode}")
+    
+    post_statuses: Dict[int, int] = {}
+    post_times: List[float] = []
+    pool = ThreadPoolExecutor(max_workers=32)
+    target = None
+    if mode == "webhook":
+        target = args.webhook_target or f"http://127.0.0.1:8443{urlsplit(state.webhook_url).path}"
+        status = post_update(target, "wrong-secret", make_update(0, FIRST_CHAT_ID - 1))
+        print(f"Webhook: {target} (wrong secret answered with {status})")
+    
+    def deliver_webhook(update: Dict[str, Any]) -> None:
+        chat_id = update["message"]["chat"]["id"]
+        started = time.perf_counter()
+        with state.cond:
+            state.delivered_at[chat_id] = started
+        status = post_update(target, state.secret_token, update)
+        with state.cond:
+            post_statuses[status] = post_statuses.get(status, 0) + 1
+            post_times.append(time.perf_counter() - started)
+    
+    started = time.perf_counter()
+    for i in range(args.updates):
+        delay = started + i / args.rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        update = make_update(i + 1, FIRST_CHAT_ID + i)
+        if mode == "webhook":
+            pool.submit(deliver_webhook, update)
+        else:
+            with state.cond:
+                state.delivered_at[update["message"]["chat"]["id"]] = time.perf_counter()
+                state.pending.append(update)
+                state.cond.notify_all()
+    
+    with state.cond:
+        state.cond.wait_for(lambda: len(state.handled_at) >= args.updates, timeout=args.timeout)
+        latencies = [state.handled_at[c] - state.delivered_at[c] for c in state.handled_at if c in state.delivered_at]
+    pool.shutdown(wait=False)
+    server.shutdown()
+    
+    print(f"\nHandled: {len(latencies)} of {args.updates} updates")
+    if post_times:
+        print(
+            f"Webhook POSTs: {json.dumps(post_statuses)}, "
+            f"p50 {percentile(post_times, 50) * 1000:.1f}ms / p95 {percentile(post_times, 95) * 1000:.1f}ms"
+        )
+    if latencies:
+        print("Update-to-handler latency (ms):")
+        for pct in (50, 90, 95, 99):
+            print(f"  p{pct}: {percentile(latencies, pct) * 1000:.1f}")
+        print(f"  max: {max(latencies) * 1000:.1f}")
+    print(f"Bot API calls: {json.dumps(state.calls)}")
+
+if __name__ == "__main__":
+    main()